@@ -1,17 +1,49 @@
-from netqasm.sdk.qubit import Qubit
 from netqasm.sdk.classical_communication.message import StructuredMessage
 from squidasm.sim.stack.program import Program, ProgramContext, ProgramMeta
-from squidasm.util.routines import teleport_send, teleport_recv
 import random
 import math
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wbc.routines import measure_fresh_batch, teleport_send_batch, teleport_recv_batch, teleport_recv_measure_batch
+from wbc.checkset import CheckSet
+from wbc.circuit import CIRCUIT, OPTIMIZED
+from wbc.templates import SubroutineTemplate
+from wbc.timing import timed_run
 
 # Number of States used for 1 bit of data sent
 NUM_STATES = 280
+# Number of qubit groups submitted per flush, see wbc.routines.batch_size
+BATCH_SIZE = 1
+# Receivers measure every teleported qubit as soon as it arrives and only keep the outcomes,
+# so they hold at most BATCH_SIZE qubits instead of NUM_STATES
+# Only valid because every check measures in the computational basis, and only kept by wbc.simulation
+# when the receivers have no single-qubit gate noise and T1 = T2 = 0
+MEASURE_ON_ARRIVAL = False
+# Receiver1 evaluates its consistency check classically instead of measuring dummy qubits:
+# a freshly initialized qubit on the generic device always measures 0
+CLASSICAL_CONSISTENCY = False
+# Emit the state-preparation circuit with merged single-qubit rotations (same CNOTs, same two-qubit noise),
+# only kept by wbc.simulation when the sender has no single-qubit gate noise and T1 = T2 = 0
+OPTIMIZE_CIRCUIT = True
+# Build and compile the sender's state-preparation subroutine only once per batch layout
+SUBROUTINE_CACHE = True
+# Add the wall time, simulated time and flush count of every phase to the results, see wbc.timing
+TIMING = False
+
+# Create and entangle the 4 qubits of every group
+# Linear Circuit Implementation, see wbc.circuit for the gate sequence and its optimized form
+# Compiled once per gate list and batch layout and resubmitted for every later batch and trial, see wbc.templates
+PREPARE = SubroutineTemplate(4)
 
 class SenderProgram(Program):
     # Other parties involved in the communication
     PEER_R0 = "Receiver0"
     PEER_R1 = "Receiver1"
+    # wbc.seeding.TrialSeeder that seeds the random generators before every trial, set by the runner
+    # together with the receivers' wait_for_seed
+    seeder = None
     
     @property
     def meta(self) -> ProgramMeta:
@@ -23,61 +55,49 @@ class SenderProgram(Program):
         )
 
     def run(self, context: ProgramContext):
+        return (yield from timed_run(self._run, context, TIMING))
+
+    def _run(self, context: ProgramContext, timer):
+        if self.seeder is not None:
+            # Barrier around the seeding: both receivers are done with the previous trial
+            # and make no random draw of this one before the generators are seeded again
+            yield from context.csockets[self.PEER_R0].recv()
+            yield from context.csockets[self.PEER_R1].recv()
+            self.seeder.seed_next()
+            context.csockets[self.PEER_R0].send(StructuredMessage("seeded", None))
+            context.csockets[self.PEER_R1].send(StructuredMessage("seeded", None))
         connection = context.connection
 
         # Generate your random data bit, 0 or 1
         x_s = random.choice([0, 1])
-        sigma_s = []
+        sigma_s = CheckSet(size=NUM_STATES)
         
-        for i in range(NUM_STATES):
-            # Create and entangle 4 qubits
-            # Linear Circuit Implementation
-            q0 = Qubit(connection)
-            q1 = Qubit(connection)
-            q2 = Qubit(connection)
-            q3 = Qubit(connection)
-            q0.rot_Z(1, 1)
-            q1.rot_Z(1, 1)
-            q2.rot_Z(1, 1)
-            q0.rot_X(1, 1)
-            q1.rot_X(1, 1)
-            q2.rot_X(1, 1)
-            q0.rot_Z(17, 6)
-            q1.rot_Z(1, 1)
-            q2.rot_Z(237, 7)
-            q2.cnot(q0)
-            q0.rot_X(1, 1)
-            q2.rot_X(1, 1)
-            q0.rot_Z(19, 7)
-            q2.rot_Z(1, 1)
-            q0.rot_X(1, 1)
-            q0.rot_Z(1, 0)
-            q1.cnot(q0)
-            q2.cnot(q0)
-            q3.cnot(q1)
-            q0.cnot(q2)
-            q1.cnot(q3)
-            q2.cnot(q0)
-            q0.cnot(q1)
-            q2.cnot(q0)
-            
+        # Qubit groups are prepared, teleported and measured BATCH_SIZE at a time
+        for start in range(0, NUM_STATES, BATCH_SIZE):
+            batch = range(start, min(start + BATCH_SIZE, NUM_STATES))
+            timer.phase("prepare")
+            gates = OPTIMIZED if OPTIMIZE_CIRCUIT else CIRCUIT
+            groups = yield from PREPARE.submit(connection, gates, len(batch), cache=SUBROUTINE_CACHE)
+
             # Teleport third qubit q2 to R0, fourth qubit q3 to R1
-            yield from connection.flush()
-            yield from teleport_send(q2, context, peer_name=self.PEER_R0)
-            yield from teleport_send(q3, context, peer_name=self.PEER_R1)
+            timer.phase("teleport")
+            yield from teleport_send_batch([g[2] for g in groups], context, peer_name=self.PEER_R0)
+            yield from teleport_send_batch([g[3] for g in groups], context, peer_name=self.PEER_R1)
 
             # Measure q0 and q1
-            m0 = q0.measure()
-            m1 = q1.measure()
+            timer.phase("measure")
+            measurements = [(g[0].measure(), g[1].measure()) for g in groups]
             yield from connection.flush()
 
-            # Check whether or not the measurement can fit into the check set
-            if int(m0) == x_s and int(m1) == x_s:
-                sigma_s.append(i)
+            for i, (m0, m1) in zip(batch, measurements):
+                # Check whether or not the measurement can fit into the check set
+                if int(m0) == x_s and int(m1) == x_s:
+                    sigma_s.add(i)
 
         # Send sender's data bit and check set to each receiver
+        timer.phase("send")
         for peer in [self.PEER_R0, self.PEER_R1]:
-            context.csockets[peer].send(StructuredMessage("invocation", [x_s, sigma_s]))
+            context.csockets[peer].send(StructuredMessage("invocation", [x_s, sigma_s.encode()]))
 
         # Return output
         return {"x_s": x_s}
@@ -89,43 +109,64 @@ class Receiver0Program(Program):
     PEER_R1 = "Receiver1"
     # MU parameter of the WBC
     MU = 0.3
-    
+    # Wait for the sender to seed the generators before every trial, set by the runner together with its seeder
+    wait_for_seed = False
+
     @property
     def meta(self) -> ProgramMeta:
         return ProgramMeta(
             name="receiver0_program",
             csockets=[self.PEER, self.PEER_R1],
             epr_sockets=[self.PEER],
-            max_qubits=NUM_STATES,
+            max_qubits=BATCH_SIZE if MEASURE_ON_ARRIVAL else NUM_STATES,
         )
 
     def run(self, context: ProgramContext):
+        return (yield from timed_run(self._run, context, TIMING))
+
+    def _run(self, context: ProgramContext, timer):
+        if self.wait_for_seed:
+            context.csockets[self.PEER].send(StructuredMessage("start", None))
+            yield from context.csockets[self.PEER].recv()
         connection = context.connection
 
-        # Receive teleported qubits
+        # Receive teleported qubits, or only their outcomes with MEASURE_ON_ARRIVAL
+        timer.phase("teleport")
         qubits = []
-        for _ in range(NUM_STATES):
-            q = yield from teleport_recv(context, peer_name=self.PEER)
-            qubits.append(q)
+        bits = bytearray()
+        for start in range(0, NUM_STATES, BATCH_SIZE):
+            count = min(BATCH_SIZE, NUM_STATES - start)
+            if MEASURE_ON_ARRIVAL:
+                batch = yield from teleport_recv_measure_batch(context, peer_name=self.PEER, number=count)
+                bits.extend(batch)
+            else:
+                batch = yield from teleport_recv_batch(context, peer_name=self.PEER, number=count)
+                qubits.extend(batch)
 
         csocket = context.csockets[self.PEER]
         csocket_r1 = context.csockets[self.PEER_R1]
 
         # Receive data bit and check set
+        timer.phase("invocation")
         msg = yield from csocket.recv()
-        x_s, sigma_s = msg.payload
+        x_s, sigma_bytes = msg.payload
+        sigma_s = CheckSet.decode(sigma_bytes)
 
         # Minimum check set length for the length condition
         T = math.ceil(self.MU * NUM_STATES)
         y0 = "abort"
         
         # Perform check phase
+        timer.phase("check")
         if len(sigma_s) >= T:
-            outcomes = []
-            for i in sigma_s:
-                outcome = qubits[i].measure()
-                outcomes.append(outcome)
-            yield from connection.flush()
+            if MEASURE_ON_ARRIVAL:
+                outcomes = [bits[i] for i in sigma_s]
+            else:
+                outcomes = []
+                for i in sigma_s:
+                    outcome = qubits[i].measure()
+                    outcomes.append(outcome)
+                yield from connection.flush()
             # Check if each pair of received qubits-data bit are different
             # If they are, consistency check passes
             # Otherwise, abort is kept
@@ -133,7 +174,8 @@ class Receiver0Program(Program):
                 y0 = x_s
 
         # Send your received data bit and check set forward to the second receiver
-        csocket_r1.send(StructuredMessage("forward", [x_s, sigma_s]))
+        timer.phase("forward")
+        csocket_r1.send(StructuredMessage("forward", [x_s, sigma_s.encode()]))
         # Return output
         return {"y0": y0}
 
@@ -146,6 +188,8 @@ class Receiver1Program(Program):
     # Parameters of the WBC
     MU = 0.3
     LAMBDA = 0.94
+    # Wait for the sender to seed the generators before every trial, set by the runner together with its seeder
+    wait_for_seed = False
 
     @property
     def meta(self) -> ProgramMeta:
@@ -153,36 +197,55 @@ class Receiver1Program(Program):
             name="receiver1_program",
             csockets=[self.PEER, self.PEER_R0],
             epr_sockets=[self.PEER],
-            max_qubits=NUM_STATES,
+            max_qubits=BATCH_SIZE if MEASURE_ON_ARRIVAL else NUM_STATES,
         )
 
     def run(self, context: ProgramContext):
+        return (yield from timed_run(self._run, context, TIMING))
+
+    def _run(self, context: ProgramContext, timer):
+        if self.wait_for_seed:
+            context.csockets[self.PEER].send(StructuredMessage("start", None))
+            yield from context.csockets[self.PEER].recv()
         connection = context.connection
 
-        # Receive teleported qubits
+        # Receive teleported qubits, or only their outcomes with MEASURE_ON_ARRIVAL
+        timer.phase("teleport")
         qubits = []
-        for _ in range(NUM_STATES):
-            q = yield from teleport_recv(context, peer_name=self.PEER)
-            qubits.append(q)
+        bits = bytearray()
+        for start in range(0, NUM_STATES, BATCH_SIZE):
+            count = min(BATCH_SIZE, NUM_STATES - start)
+            if MEASURE_ON_ARRIVAL:
+                batch = yield from teleport_recv_measure_batch(context, peer_name=self.PEER, number=count)
+                bits.extend(batch)
+            else:
+                batch = yield from teleport_recv_batch(context, peer_name=self.PEER, number=count)
+                qubits.extend(batch)
 
         csocket = context.csockets[self.PEER]
         csocket_r0 = context.csockets[self.PEER_R0]
 
         # Receive data bit and check set
+        timer.phase("invocation")
         msg = yield from csocket.recv()
-        x_s, sigma_s = msg.payload
+        x_s, sigma_bytes = msg.payload
+        sigma_s = CheckSet.decode(sigma_bytes)
 
         # Minimum check set length for the length condition
         T = math.ceil(self.MU * NUM_STATES)
         y1_tilde = "abort"
 
         # Perform check phase
+        timer.phase("check")
         if len(sigma_s) >= T:
-            outcomes = []
-            for i in sigma_s:
-                outcome = qubits[i].measure()
-                outcomes.append(outcome)
-            yield from connection.flush()
+            if MEASURE_ON_ARRIVAL:
+                outcomes = [bits[i] for i in sigma_s]
+            else:
+                outcomes = []
+                for i in sigma_s:
+                    outcome = qubits[i].measure()
+                    outcomes.append(outcome)
+                yield from connection.flush()
             # Check if each pair of received qubits-data bit are different
             # If they are, consistency check passes
             # Otherwise, abort is kept
@@ -190,9 +253,12 @@ class Receiver1Program(Program):
                 y1_tilde = x_s
         
         # Receive forwarded bit and check set from First Receiver
+        timer.phase("forward")
         msg2 = yield from csocket_r0.recv()
-        x0_fwd, sigma0_fwd = msg2.payload
+        x0_fwd, sigma0_bytes = msg2.payload
+        sigma0_fwd = CheckSet.decode(sigma0_bytes)
 
+        timer.phase("consistency")
         # Confusion property check
         confusion_ok = x0_fwd != y1_tilde and x0_fwd != "abort" and y1_tilde != "abort"
         # Length check
@@ -201,13 +267,12 @@ class Receiver1Program(Program):
         consistency_ok = False
         if length_ok:
             required = math.ceil(self.LAMBDA * T + len(sigma0_fwd) - T)
-            mismatch = 0
-            for _ in sigma0_fwd:
-                dummy_q = Qubit(connection)
-                m = dummy_q.measure()
-                yield from connection.flush()
-                if int(m) != x0_fwd:
-                    mismatch += 1
+            # Dummy qubits are prepared and measured in a single subroutine, or not at all with CLASSICAL_CONSISTENCY
+            if CLASSICAL_CONSISTENCY:
+                dummy_outcomes = [0] * len(sigma0_fwd)
+            else:
+                dummy_outcomes = yield from measure_fresh_batch(connection, len(sigma0_fwd))
+            mismatch = sum(1 for m in dummy_outcomes if m != x0_fwd)
             consistency_ok = mismatch >= required
 
         # Return output
@@ -1,5 +1,20 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wbc import aggregate, exact
+
+# The points are read from this folder's sweep: the result store if there is one,
+# otherwise the results_p=<p>.csv files; the thesis values below are used when neither exists
+RESULTS_DB = "results.sqlite"
+ENGINE = "squidasm"
+NUM_STATES = 280
+# Base seed of the sweep, as SEED in the simulation script (None for unseeded trials)
+SEED = 0
+# Seconds between redraws while a sweep is still running (None draws once)
+REFRESH_SECONDS = None
 
 error_rates = [0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1]
 failure_probs = [0.14, 0.13, 0.14, 0.1, 0.12, 0.25, 0.44, 0.73, 0.85, 1, 1, 1]
@@ -8,8 +23,27 @@ failure_probs = [0.14, 0.13, 0.14, 0.1, 0.12, 0.25, 0.44, 0.73, 0.85, 1, 1, 1]
 n = 500
 stderr = [np.sqrt(p * (1 - p) / n) for p in failure_probs]
 
-plt.figure(figsize=(8, 5))
-plt.errorbar(error_rates, failure_probs, yerr=stderr, fmt='o', ecolor='gray', capsize=3, linestyle='None')
+feed = aggregate.folder_feed(".", RESULTS_DB, "r0_faulty", ENGINE, NUM_STATES, SEED)
+results = aggregate.Aggregator()
+feed.poll(results)
+points = None
+
+# Draw the failure rate of every value, from the sweep results when there are any
+def draw_points():
+    global points
+    rates, probs, errors = error_rates, failure_probs, stderr
+    if results.rates():
+        rates, _, probs, errors = zip(*results.rates())
+    if points is not None:
+        points.remove()
+    points = plt.errorbar(rates, probs, yerr=errors, fmt='o', ecolor='gray', capsize=3, linestyle='None')
+
+figure = plt.figure(figsize=(8, 5))
+draw_points()
+# Exact failure probability of the modelled circuit, without sampling noise
+exact_rates = np.logspace(-6, -1, 60)
+exact_probs = [exact.failure_probability("r0_faulty", p, NUM_STATES) for p in exact_rates]
+plt.plot(exact_rates, exact_probs, color='black', linewidth=1, label='Exact (NumPy model)')
 # Optional log scale for better visualization
 plt.xscale('log')
 
@@ -35,6 +69,18 @@ plt.text(1e-5, 0.12, 'R0 faulty, error-free failure rate', color='orange', fonts
 plt.xlabel("Error Rate (Axis on Log Scale for easier visualization)")
 plt.ylabel("Failure Probability")
 plt.title("R0 Faulty Configuration - Failure Probability vs. Gate-Level Error Rate (m = 280)")
+plt.legend(loc='upper left', fontsize=9)
 plt.grid(True, which='major', linestyle='--', linewidth=0.5)
 plt.tight_layout()
-plt.show()
\ No newline at end of file
+
+if REFRESH_SECONDS:
+    # Follow a running sweep until the window is closed
+    plt.show(block=False)
+    while plt.fignum_exists(figure.number):
+        plt.pause(REFRESH_SECONDS)
+        if feed.poll(results):
+            draw_points()
+            for p, trials, rate, error in results.rates():
+                print(f"p={p:.8f}: {rate:.3f} ± {error:.3f} ({trials} trials)")
+else:
+    plt.show()
\ No newline at end of file
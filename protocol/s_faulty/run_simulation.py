@@ -1,11 +1,19 @@
 import time
 
+import application
 from application import SenderProgram, Receiver0Program, Receiver1Program
 from squidasm.run.stack.config import StackNetworkConfig
 from squidasm.run.stack.run import run
+from wbc.circuit import CIRCUIT, OPTIMIZED, describe
+from wbc import netconfig
+from wbc.simulation import application_constants
 
 # Import network configuration
 cfg = StackNetworkConfig.from_file("config.yaml")
+# Batch size from the sender's memory, and no OPTIMIZE_CIRCUIT or MEASURE_ON_ARRIVAL with single-qubit noise
+for name, value in application_constants("s_faulty", netconfig.load_config("config.yaml"),
+                                         NUM_STATES=application.NUM_STATES).items():
+    setattr(application, name, value)
 
 # Create program instances
 sender_program = SenderProgram()
@@ -21,4 +29,8 @@ run(config=cfg, programs={
 }, num_times=1)
 
 end_time = time.time()
-print(f"Execution time: {end_time - start_time:.2f} seconds")
\ No newline at end of file
+print(f"Execution time: {end_time - start_time:.2f} seconds")
+# Gates emitted per qubit group by the sender, before and after wbc.circuit.optimize
+print(f"State preparation: {describe(CIRCUIT)}")
+if application.OPTIMIZE_CIRCUIT:
+    print(f"Optimized:         {describe(OPTIMIZED)}")
\ No newline at end of file
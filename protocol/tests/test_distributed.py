@@ -0,0 +1,77 @@
+"""Coordinator and workers of wbc.distributed, on localhost"""
+import os
+import signal
+import socket
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wbc import distributed, scheduler
+
+# Directory of the marker files, handed to the workers by the initializer
+STATE = {}
+
+
+def set_state(directory):
+    STATE["directory"] = directory
+
+
+def count_chunk(job):
+    """Counts of a toy chunk; the first worker to take chunk 0 of value 1 dies instead"""
+    idx, value, start, size = job
+    if (value, start) == (1, 0):
+        try:
+            os.close(os.open(os.path.join(STATE["directory"], "killed"), os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            pass
+        else:
+            os._exit(1)
+    return (idx, value), {"trials": size, "failures": sum(1 for trial in range(start, start + size) if trial % 3 == 0)}
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture(autouse=True)
+def deadline():
+    # A hang in the coordinator fails the test instead of blocking the suite
+    def expire(signum, frame):
+        raise TimeoutError("run_jobs did not return")
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.alarm(60)
+    yield
+    signal.alarm(0)
+    signal.signal(signal.SIGALRM, previous)
+
+
+def expected(values, num_trials):
+    return {(idx, value): {"trials": num_trials, "failures": sum(1 for trial in range(num_trials) if trial % 3 == 0)}
+            for idx, value in enumerate(values)}
+
+
+def test_requeues_chunk_of_killed_worker(tmp_path):
+    values = [0, 1, 2]
+    jobs = scheduler.make_jobs(values, 100, 10)
+    totals = distributed.run_jobs(count_chunk, jobs, address=("127.0.0.1", free_port()), processes=3,
+                                  initializer=set_state, initargs=(str(tmp_path),))
+    assert (tmp_path / "killed").exists()
+    assert totals == expected(values, 100)
+
+
+@pytest.mark.parametrize("processes", [3, 6])
+def test_returns_with_more_workers_than_jobs(tmp_path, processes):
+    for _ in range(3):
+        jobs = scheduler.make_jobs([0, 2], 20, 10)
+        totals = distributed.run_jobs(count_chunk, jobs, address=("127.0.0.1", free_port()), processes=processes,
+                                      initializer=set_state, initargs=(str(tmp_path),))
+        assert totals == expected([0, 2], 20)
+
+
+def test_refuses_public_address_with_default_key():
+    with pytest.raises(ValueError, match="WBC_AUTHKEY"):
+        distributed.run_jobs(count_chunk, [(0, 0, 0, 1)], address=("0.0.0.0", free_port()),
+                             authkey=distributed.DEFAULT_AUTHKEY)
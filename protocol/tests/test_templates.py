@@ -0,0 +1,75 @@
+"""Subroutines resubmitted by wbc.templates against fresh builds, on NetQASM's DebugConnection"""
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("netqasm")
+from netqasm.backend.messages import SubroutineMessage
+from netqasm.sdk.connection import DebugConnection
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wbc.circuit import CIRCUIT, OPTIMIZED
+from wbc.templates import SubroutineTemplate
+
+
+class GeneratorConnection(DebugConnection):
+    """DebugConnection that flushes and commits like SquidASM's stack connection, as generators"""
+
+    def flush(self, block=True, callback=None):
+        protosubroutine = self.builder.subrt_pop_pending_subroutine()
+        if protosubroutine is None:
+            return
+        yield from self.commit_subroutine(self.builder.subrt_compile_subroutine(protosubroutine), block, callback)
+        self.builder._reset()
+
+    def commit_subroutine(self, subroutine, block=True, callback=None):
+        self._commit_message(msg=SubroutineMessage(subroutine=subroutine), block=block, callback=callback)
+        yield from ()
+
+
+def drive(generator):
+    """Run a program generator that never waits on the simulator, return its value"""
+    try:
+        while True:
+            next(generator)
+    except StopIteration as stop:
+        return stop.value
+
+
+def trial(template, app_id, circuit, batches=(3, 3, 2), cache=True):
+    """Messages a connection commits for one trial: every batch prepared, then measured"""
+    connection = GeneratorConnection("Sender", app_id=app_id, max_qubits=4 * max(batches))
+    start = len(connection.storage)
+    for copies in batches:
+        groups = drive(template.submit(connection, circuit, copies, cache=cache))
+        for group in groups:
+            for qubit in group:
+                qubit.measure()
+        drive(connection.flush())
+    messages = connection.storage[start:]
+    connection.close()
+    return messages
+
+
+@pytest.mark.parametrize("circuit", [CIRCUIT, OPTIMIZED])
+def test_resubmitted_subroutines_match_fresh_builds(circuit):
+    template = SubroutineTemplate(4)
+    # Later trials run under other app ids, like the iterations of a SquidASM run
+    cached = [trial(template, app_id, circuit) for app_id in (1, 2, 3)]
+    fresh = [trial(SubroutineTemplate(4), app_id, circuit, cache=False) for app_id in (1, 2, 3)]
+    assert cached == fresh
+    assert template.hits > 0
+    assert not template.uncacheable
+
+
+def test_mismatching_subroutine_is_not_reused():
+    template = SubroutineTemplate(4)
+    trial(template, 1, CIRCUIT, batches=(2,))
+    # Corrupt the cached subroutine: its first reuse has to submit a fresh build instead
+    compiled = next(iter(template.compiled.values()))
+    compiled.instructions = compiled.instructions[:-1]
+    assert trial(template, 2, CIRCUIT, batches=(2, 2)) == trial(SubroutineTemplate(4), 2, CIRCUIT, batches=(2, 2),
+                                                               cache=False)
+    assert template.hits == 0
+    assert len(template.uncacheable) == 1
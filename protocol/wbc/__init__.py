@@ -0,0 +1,6 @@
+"""Shared helpers for the WBC(3,1) simulations.
+
+The per-strategy folders (no_faulty, s_faulty, r0_faulty) are still run from
+inside their own directory, so they add the parent `protocol/` directory to
+`sys.path` before importing from this package.
+"""
@@ -0,0 +1,116 @@
+"""Incremental aggregation of sweep results, readable while a sweep is running
+
+An `Aggregator` keeps the trial, failure and time counts of every
+depolarization value. Feeds bring it up to date: `StoreFeed` reads only the
+trials appended to a result store since its last poll, and `CsvFeed` re-reads
+the results_p=<p>.csv files that changed since its last poll. Polling is
+cheap, so a plot or a progress printout can call it in a loop.
+"""
+import csv
+import glob
+import math
+import os
+
+from wbc import importance, scheduler
+from wbc.store import ResultStore
+
+
+def standard_error(failures, trials):
+    """Binomial standard error of the failure rate"""
+    if not trials:
+        return float("nan")
+    rate = failures / trials
+    return math.sqrt(rate * (1 - rate) / trials)
+
+
+class Aggregator:
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, p, counts):
+        """Merge new counts of depolarization value `p`"""
+        scheduler.merge_counts(self.counts.setdefault(float(p), {}), counts)
+
+    def replace(self, p, counts):
+        """Replace the counts of `p` with totals read elsewhere"""
+        self.counts[float(p)] = dict(counts)
+
+    def rates(self):
+        """(p, trials, failure rate, standard error) of every value, by increasing p"""
+        rows = []
+        for p in sorted(self.counts):
+            trials = self.counts[p].get("trials", 0)
+            if trials:
+                rows.append((p, trials) + importance.estimate(self.counts[p]))
+        return rows
+
+
+class StoreFeed:
+    """Trials of one strategy, engine, number of states and base seed appended to a result store"""
+
+    def __init__(self, path, model, engine, num_states, seed):
+        self.path = path
+        self.model = model
+        self.engine = engine
+        self.num_states = num_states
+        self.seed = seed
+        self.last_rowid = 0
+
+    def poll(self, aggregator):
+        """Add the trials recorded since the last poll, returns how many there were"""
+        if not os.path.exists(self.path):
+            return 0
+        store = ResultStore(self.path)
+        rows = store.trials_after(self.model, self.engine, self.num_states, self.seed, self.last_rowid)
+        store.close()
+        for rowid, p, failed, elapsed, weighted in rows:
+            counts = {"trials": 1, "successes": 1 - failed, "failures": failed, "time": elapsed}
+            if weighted is not None:
+                counts.update({"weighted_failures": weighted, "weighted_failures_sq": weighted * weighted})
+            aggregator.add(p, counts)
+            self.last_rowid = max(self.last_rowid, rowid)
+        return len(rows)
+
+
+class CsvFeed:
+    """results_p=<p>.csv files written by a simulation script, re-read when they change"""
+
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.modified = {}
+
+    def poll(self, aggregator):
+        """Read the files changed since the last poll, returns how many there were"""
+        changed = 0
+        for path in glob.glob(os.path.join(self.directory, "results_p=*.csv")):
+            mtime = os.path.getmtime(path)
+            if self.modified.get(path) == mtime:
+                continue
+            with open(path, newline="") as f:
+                rows = list(csv.DictReader(f))
+            if not rows:
+                # Caught in the middle of a rewrite, read it again next time
+                continue
+            row = rows[-1]
+            trials = int(row["Trials"])
+            counts = {
+                "trials": trials,
+                "successes": int(row["Successes"]),
+                "failures": int(row["Failures"]),
+                "time": float(row["Avg_Time"]) * trials,
+            }
+            if row.get("Weighted_Failures"):
+                counts.update({"weighted_failures": float(row["Weighted_Failures"]),
+                               "weighted_failures_sq": float(row["Weighted_Failures_Sq"])})
+            aggregator.replace(float(row["Depolar_Prob"]), counts)
+            self.modified[path] = mtime
+            changed += 1
+        return changed
+
+
+def folder_feed(directory, results_db, model, engine, num_states, seed):
+    """StoreFeed if the folder has a result store, otherwise a CsvFeed over its result files"""
+    path = os.path.join(directory, results_db) if results_db else None
+    if path and os.path.exists(path):
+        return StoreFeed(path, model, engine, num_states, seed)
+    return CsvFeed(directory)
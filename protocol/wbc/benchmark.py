@@ -0,0 +1,203 @@
+"""Throughput benchmarks of the three strategies
+
+Usage, from the protocol/ directory:
+
+    python -m wbc.benchmark --output baseline.json
+    python -m wbc.benchmark --baseline baseline.json
+    python -m wbc.benchmark --single-trial
+
+Every case (strategy, NUM_STATES, depolarization value) runs `--trials`
+trials with the selected engine, through the same runner as the simulation
+scripts, in a fresh process, and keeps the fastest of `--repeat` runs. It
+reports trials per second, the peak resident set size of that process and
+the NetSquid event counters. With `--single-trial` each folder's
+run_simulation.py is timed as a subprocess instead. Results are written as
+JSON; given a `--baseline` file, cases that got slower by more than
+`--tolerance` are listed and the exit code is 1.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from wbc import netconfig, runner
+from wbc.orchestrator import STRATEGIES
+from wbc.simulation import PROTOCOL_DIR, application_constants, load_application
+
+NUM_STATES = [40, 140, 280, 1000]
+DEPOLAR_VALUES = [0.0001, 0.01]
+KEY_FIELDS = ("mode", "engine", "model", "num_states", "p")
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process, in MiB"""
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def simulator_events():
+    """Event counters of the NetSquid simulator since its last reset"""
+    import netsquid as ns
+
+    data = getattr(ns.sim_stats(), "data", {})
+    return {name: value for name, value in data.items()
+            if "event" in name and isinstance(value, (int, float))}
+
+
+def with_receiver_memory(config, num_states, receivers=("Receiver0", "Receiver1")):
+    """Copy of `config` whose receivers' qdevices hold at least `num_states` qubits
+
+    A receiver keeps up to NUM_STATES teleported qubits (its ProgramMeta
+    budget), more than config.yaml provides for the largest cases.
+    """
+    small = [stack["name"] for stack in config.get("stacks", []) if stack.get("name") in receivers
+             and stack.get("qdevice_cfg", {}).get("num_qubits", num_states) < num_states]
+    return netconfig.with_qdevice(config, stacks=small, num_qubits=num_states) if small else config
+
+
+def run_case(engine, model, num_states, p, trials, repeat=1):
+    """Time `trials` trials of one configuration, best of `repeat` runs, in the current process"""
+    base = netconfig.load_config(os.path.join(PROTOCOL_DIR, model, "config.yaml"))
+    cfg = programs = None
+    if engine == "squidasm":
+        variant = netconfig.with_qdevice(with_receiver_memory(base, num_states), two_qubit_gate_depolar_prob=float(p))
+        cfg = netconfig.stack_network_config(variant)
+        application = load_application(model, **application_constants(model, variant, NUM_STATES=num_states))
+        programs = {
+            "Sender": application.SenderProgram(),
+            "Receiver0": application.Receiver0Program(),
+            "Receiver1": application.Receiver1Program(),
+        }
+
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        runner.run_trials(engine, model, cfg, p, num_states, trials, programs)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return {
+        "trials": trials,
+        "seconds": elapsed,
+        "trials_per_s": trials / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "events": simulator_events() if engine == "squidasm" else None,
+    }
+
+
+def run_isolated(engine, model, num_states, p, trials, repeat=1):
+    """run_case in a freshly spawned process, so that peak RSS is per case"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, engine, model, num_states, p, trials, repeat).result()
+
+
+def run_script(model, script="run_simulation.py"):
+    """Time one execution of a strategy's run_simulation.py, including start-up"""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, script], cwd=os.path.join(PROTOCOL_DIR, model),
+                               stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code != 0:
+        raise RuntimeError(f"{model}/{script} exited with code {exit_code}")
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "trials": 1,
+        "seconds": elapsed,
+        "trials_per_s": 1 / elapsed,
+        "peak_rss_mb": usage.ru_maxrss / scale,
+        "events": None,
+    }
+
+
+def case_key(case):
+    return tuple(case[field] for field in KEY_FIELDS)
+
+
+def compare(cases, baseline, tolerance):
+    """(case, baseline trials/s, ratio) of every case in the baseline, and the regressed ones"""
+    previous = {case_key(case): case for case in baseline["cases"]}
+    rows, regressed = [], []
+    for case in cases:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        ratio = case["trials_per_s"] / old["trials_per_s"]
+        rows.append((case, old["trials_per_s"], ratio))
+        if ratio < 1 - tolerance:
+            regressed.append(case)
+    return rows, regressed
+
+
+def describe(case):
+    if case["mode"] == "script":
+        return f"{case['model']:<10} run_simulation.py"
+    return f"{case['model']:<10} {case['engine']:<12} m={case['num_states']:<5} p={case['p']:<8g}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", default="squidasm", choices=runner.ENGINES)
+    parser.add_argument("--models", nargs="+", default=STRATEGIES, choices=STRATEGIES)
+    parser.add_argument("--num-states", nargs="+", type=int, default=NUM_STATES)
+    parser.add_argument("--depolar", nargs="+", type=float, default=DEPOLAR_VALUES)
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest one is kept")
+    parser.add_argument("--single-trial", action="store_true",
+                        help="time each strategy's run_simulation.py instead of the grid")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown in trials/s reported as a regression")
+    args = parser.parse_args(argv)
+
+    cases = []
+    if args.single_trial:
+        for model in args.models:
+            case = {"mode": "script", "engine": "squidasm", "model": model, "num_states": None, "p": None}
+            case.update(run_script(model))
+            print(f"{describe(case)}  {case['seconds']:8.2f} s  {case['peak_rss_mb']:8.1f} MiB")
+            cases.append(case)
+    else:
+        for model in args.models:
+            for num_states in args.num_states:
+                for p in args.depolar:
+                    case = {"mode": "runner", "engine": args.engine, "model": model,
+                            "num_states": num_states, "p": p}
+                    case.update(run_isolated(args.engine, model, num_states, p, args.trials, args.repeat))
+                    print(f"{describe(case)}  {case['trials_per_s']:10.2f} trials/s  "
+                          f"{case['peak_rss_mb']:8.1f} MiB")
+                    cases.append(case)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cases": cases,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows, regressed = compare(cases, baseline, args.tolerance)
+        print(f"\nCompared with {args.baseline}:")
+        for case, old, ratio in rows:
+            print(f"  {describe(case)}  {old:10.2f} -> {case['trials_per_s']:10.2f} trials/s  ({ratio:.2f}x)")
+        if regressed:
+            print(f"\n{len(regressed)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Small on-disk cache for results that only depend on simulation parameters
+
+Entries are JSON files named after a hash of their key, grouped in one folder
+per namespace. Keys are plain dicts, so anything that changes the result (the
+circuit, noise parameters, ...) must be part of the key.
+"""
+import hashlib
+import json
+import os
+
+# Default location, next to the strategy folders; WBC_CACHE_DIR overrides it
+CACHE_DIR = os.environ.get(
+    "WBC_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+)
+
+
+def cache_key(key):
+    """Stable hash of a JSON-serialisable key"""
+    encoded = json.dumps(key, sort_keys=True, default=repr).encode()
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _path(namespace, key):
+    return os.path.join(CACHE_DIR, namespace, f"{cache_key(key)}.json")
+
+
+def load(namespace, key):
+    """Cached value for `key`, or None if there is none"""
+    try:
+        with open(_path(namespace, key), "r") as f:
+            return json.load(f)["value"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def store(namespace, key, value):
+    """Cache `value` for `key`
+
+    Writes go through a temporary file so that parallel workers never read a
+    half-written entry.
+    """
+    path = _path(namespace, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "value": value}, f, default=repr)
+    os.replace(tmp_path, path)
+
+
+def cached(namespace, key, compute):
+    """Return the cached value for `key`, computing and storing it if missing
+
+    `compute` is called without arguments and must return a JSON-serialisable
+    value.
+    """
+    value = load(namespace, key)
+    if value is None:
+        value = compute()
+        store(namespace, key, value)
+    return value
@@ -0,0 +1,58 @@
+"""Compact check sets of qubit-group indices
+
+A `CheckSet` is a bitmap with one bit per index, so membership tests are
+O(1) and the set travels in classical messages as `encode()`'s bytes (one
+bit per qubit group, 35 bytes for 280 groups) instead of a list of ints.
+Iteration yields the indices in increasing order.
+"""
+
+# Number of set bits of every byte value
+POPCOUNT = bytes(bin(value).count("1") for value in range(256))
+
+
+class CheckSet:
+    def __init__(self, indices=(), size=0):
+        self._bits = bytearray((size + 7) // 8)
+        self._count = 0
+        for index in indices:
+            self.add(index)
+
+    def add(self, index):
+        byte, mask = index >> 3, 1 << (index & 7)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._count += 1
+
+    def __contains__(self, index):
+        byte = index >> 3
+        return 0 <= byte < len(self._bits) and bool(self._bits[byte] >> (index & 7) & 1)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for byte_index, byte in enumerate(self._bits):
+            if byte:
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        yield byte_index * 8 + bit
+
+    def __eq__(self, other):
+        return isinstance(other, CheckSet) and self.encode() == other.encode()
+
+    def __repr__(self):
+        return f"CheckSet({list(self)})"
+
+    def encode(self):
+        """Bitmap bytes, index i is bit i % 8 of byte i // 8; trailing zero bytes are dropped"""
+        return bytes(self._bits).rstrip(b"\0")
+
+    @classmethod
+    def decode(cls, data):
+        """CheckSet from the bytes of `encode`"""
+        check_set = cls()
+        check_set._bits = bytearray(data)
+        check_set._count = sum(POPCOUNT[byte] for byte in data)
+        return check_set
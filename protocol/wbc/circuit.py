@@ -0,0 +1,202 @@
+"""Gate-sequence IR of the sender's state preparation and a peephole optimizer
+
+Usage, from the protocol/ directory:
+
+    python -m wbc.circuit
+
+A circuit is a list of gates on qubits (q0, q1, q2, q3). Rotations are
+(gate, (qubit,), (n, d)) with angle n * pi / 2^d, as in NetQASM, and CNOTs
+are ("cnot", (control, target), None), i.e. q2.cnot(q0) is ("cnot", (2, 0), None).
+
+`optimize` only applies exact rewrites and never moves, adds or removes a
+CNOT, so the two-qubit depolarization of the generic device sees the same
+gates. Single-qubit gates are noiseless in every config.yaml; with a
+nonzero `single_qubit_gate_depolar_prob` the optimized circuit has fewer
+noisy gates than the original one.
+"""
+
+# Gate sequence of SenderProgram.run as written in the thesis
+CIRCUIT = [
+    ("rot_Z", (0,), (1, 1)),
+    ("rot_Z", (1,), (1, 1)),
+    ("rot_Z", (2,), (1, 1)),
+    ("rot_X", (0,), (1, 1)),
+    ("rot_X", (1,), (1, 1)),
+    ("rot_X", (2,), (1, 1)),
+    ("rot_Z", (0,), (17, 6)),
+    ("rot_Z", (1,), (1, 1)),
+    ("rot_Z", (2,), (237, 7)),
+    ("cnot", (2, 0), None),
+    ("rot_X", (0,), (1, 1)),
+    ("rot_X", (2,), (1, 1)),
+    ("rot_Z", (0,), (19, 7)),
+    ("rot_Z", (2,), (1, 1)),
+    ("rot_X", (0,), (1, 1)),
+    ("rot_Z", (0,), (1, 0)),
+    ("cnot", (1, 0), None),
+    ("cnot", (2, 0), None),
+    ("cnot", (3, 1), None),
+    ("cnot", (0, 2), None),
+    ("cnot", (1, 3), None),
+    ("cnot", (2, 0), None),
+    ("cnot", (0, 1), None),
+    ("cnot", (2, 0), None),
+]
+
+ROTATIONS = ("rot_X", "rot_Z")
+
+
+def normalize(n, d):
+    """(n, d) of the same rotation with 0 <= n < 2^(d + 1) and n odd unless d = 0, or None for the identity
+
+    A rotation by 2 pi is -I, a global phase, so angles are taken modulo 2 pi.
+    """
+    n %= 2 ** (d + 1)
+    if n == 0:
+        return None
+    while d > 0 and n % 2 == 0:
+        n, d = n // 2, d - 1
+    return n, d
+
+
+def add_angles(first, second):
+    (n1, d1), (n2, d2) = first, second
+    d = max(d1, d2)
+    return normalize(n1 * 2 ** (d - d1) + n2 * 2 ** (d - d2), d)
+
+
+def negate(angle):
+    n, d = angle
+    return normalize(-n, d)
+
+
+def is_pi(angle):
+    return normalize(*angle) == (1, 0)
+
+
+def commutes(rotation, gate):
+    """Whether a rotation commutes with `gate`: disjoint qubits, or a CNOT it passes through
+
+    Z rotations commute with the control of a CNOT and X rotations with its
+    target. The depolarization that follows a noisy CNOT commutes with any
+    single-qubit unitary, so this holds for the noisy gates as well.
+    """
+    name, (qubit,), _ = rotation
+    if qubit not in gate[1]:
+        return True
+    if gate[0] == "cnot":
+        control, target = gate[1]
+        return (name == "rot_Z" and qubit == control) or (name == "rot_X" and qubit == target)
+    return False
+
+
+def drop_initial_z(circuit):
+    """Remove Z rotations acting on a freshly initialized |0>, where they are a global phase"""
+    touched = set()
+    result = []
+    for gate in circuit:
+        if gate[0] == "rot_Z" and gate[1][0] not in touched:
+            continue
+        touched.update(gate[1])
+        result.append(gate)
+    return result
+
+
+def merge_rotations(circuit):
+    """Merge every rotation into an earlier one about the same axis on the same qubit, where exact
+
+    A rotation moves back past gates it commutes with. It also moves past a
+    rotation by pi about the other axis, as R_A(pi) R_B(t) = R_B(-t) R_A(pi)
+    up to a global phase, which negates whichever of the two is not the pi
+    rotation. Rotations that merge to the identity are removed.
+    """
+    circuit = [gate if gate[0] not in ROTATIONS else (gate[0], gate[1], normalize(*gate[2])) for gate in circuit]
+    circuit = [gate for gate in circuit if gate[0] not in ROTATIONS or gate[2] is not None]
+    i = 0
+    while i < len(circuit):
+        gate = circuit[i]
+        if gate[0] not in ROTATIONS:
+            i += 1
+            continue
+        name, (qubit,), angle = gate
+        negated = []
+        target = None
+        for j in range(i - 1, -1, -1):
+            other = circuit[j]
+            if other[0] in ROTATIONS and other[1] == (qubit,):
+                if other[0] == name:
+                    target = j
+                    break
+                if is_pi(other[2]):
+                    angle = negate(angle)
+                    continue
+                if is_pi(angle):
+                    negated.append(j)
+                    continue
+                break
+            if not commutes(gate, other):
+                break
+        if target is None:
+            i += 1
+            continue
+        for j in negated:
+            other = circuit[j]
+            circuit[j] = (other[0], other[1], negate(other[2]))
+        merged = add_angles(circuit[target][2], angle)
+        del circuit[i]
+        if merged is None:
+            del circuit[target]
+            i -= 1
+        else:
+            circuit[target] = (name, (qubit,), merged)
+    return circuit
+
+
+def optimize(circuit):
+    """Equivalent circuit with fewer single-qubit rotations and the same CNOTs, see the passes above"""
+    while True:
+        optimized = merge_rotations(drop_initial_z(circuit))
+        if optimized == circuit:
+            return optimized
+        circuit = optimized
+
+
+def counts(circuit):
+    """Number of gates of every kind in `circuit`, and their total"""
+    result = {}
+    for gate in circuit:
+        result[gate[0]] = result.get(gate[0], 0) + 1
+    result["total"] = len(circuit)
+    return result
+
+
+def apply(circuit, qubits):
+    """Add the gates of `circuit` to the NetQASM qubits `qubits`"""
+    for name, operands, angle in circuit:
+        if name == "cnot":
+            control, target = operands
+            qubits[control].cnot(qubits[target])
+        else:
+            n, d = angle
+            getattr(qubits[operands[0]], name)(n, d)
+
+
+OPTIMIZED = optimize(CIRCUIT)
+
+
+def describe(circuit):
+    return ", ".join(f"{name} {n}" for name, n in counts(circuit).items())
+
+
+def main():
+    print(f"Original:  {describe(CIRCUIT)}")
+    print(f"Optimized: {describe(OPTIMIZED)}")
+    for name, operands, angle in OPTIMIZED:
+        if name == "cnot":
+            print(f"  q{operands[0]}.cnot(q{operands[1]})")
+        else:
+            print(f"  q{operands[0]}.{name}{angle}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Sweep jobs served over TCP to workers on any number of hosts
+
+`run_jobs` is a drop-in for wbc.scheduler.run_jobs that, instead of a local
+process pool, listens on a TCP address and hands the jobs out one at a time
+to every worker that connects. Start workers on any host with the same
+checkout of this repository, from the protocol/ directory:
+
+    python -m wbc.distributed worker coordinator-host:5555 --processes 8
+
+A worker receives the chunk function and the pool initializer by reference
+("module:function", or "folder/script.py:function" relative to protocol/),
+loads them from its own checkout, runs the initializer and then pulls jobs
+and pushes back their (key, counts) until the coordinator has none left.
+Workers keep waiting for the next sweep for `--wait` seconds afterwards, so
+the same workers serve every phase of a run. The coordinator can start some
+workers of its own as well (`processes`).
+
+A job whose worker disconnects (the process dies, the host goes down and its
+TCP connection is reset) or does not answer within `lease` seconds is put
+back in front of the queue for the next idle worker. A late answer from a
+dropped worker is discarded, and with the per-trial seeds of wbc.seeding a
+re-run chunk gives the same results anyway. An exception in the chunk
+function stops the sweep, as it does with a process pool.
+
+Messages are pickled and authenticated with HMAC using `authkey` (the
+WBC_AUTHKEY environment variable, "wbc" by default). Pickles execute code
+when they are loaded, so only serve on networks where every host is trusted.
+With the public default key, `run_jobs` only binds loopback addresses.
+Workers record their trials in their own checkout's result store.
+"""
+import argparse
+import collections
+import hashlib
+import importlib
+import importlib.util
+import ipaddress
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError, Event, Process, cpu_count
+from multiprocessing.connection import Client, Listener
+
+from wbc import scheduler
+
+PROTOCOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PORT = 5555
+DEFAULT_AUTHKEY = b"wbc"
+AUTHKEY = os.environ.get("WBC_AUTHKEY", DEFAULT_AUTHKEY.decode()).encode()
+# Pending connections the coordinator's socket queues
+BACKLOG = 128
+# Seconds the coordinator waits for its local workers to exit before terminating them
+JOIN_TIMEOUT = 5.0
+
+
+def parse_address(text):
+    """(host, port) of "host:port", "host" or ":port" """
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return host or "0.0.0.0", int(port or DEFAULT_PORT)
+
+
+def is_loopback(host):
+    """Whether `host` only accepts connections from this machine ("" and "0.0.0.0" do not)"""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback if host else False
+    except (OSError, ValueError):
+        return False
+
+
+def reference(function):
+    """How a worker finds `function`: "module:name", or "path.py:name" for a script run directly"""
+    module = sys.modules[function.__module__]
+    spec = getattr(module, "__spec__", None)
+    if spec is not None and spec.name and spec.name != "__main__":
+        return f"{spec.name}:{function.__name__}"
+    path = os.path.relpath(os.path.abspath(module.__file__), PROTOCOL_DIR)
+    return f"{path}:{function.__name__}"
+
+
+def source_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Scripts loaded by this worker process, by path, so that their top level runs once
+SCRIPTS = {}
+
+
+def _load_script(path):
+    if path not in SCRIPTS:
+        folder = os.path.dirname(path)
+        # Scripts import their own folder's application.py and use paths relative to their folder
+        os.chdir(folder)
+        sys.path.insert(0, folder)
+        sys.modules.pop("application", None)
+        name = "wbc_task_" + os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        SCRIPTS[path] = module
+    os.chdir(os.path.dirname(path))
+    return SCRIPTS[path]
+
+
+def resolve(ref):
+    """Module and function of a `reference`"""
+    name, _, function = ref.rpartition(":")
+    if name.endswith(".py"):
+        module = _load_script(os.path.join(PROTOCOL_DIR, name))
+    else:
+        module = importlib.import_module(name)
+    return module, getattr(module, function)
+
+
+def run_jobs(worker, jobs, address=("0.0.0.0", DEFAULT_PORT), processes=0, on_result=None,
+             initializer=None, initargs=(), authkey=AUTHKEY, lease=None):
+    """Serve `jobs` to TCP workers and return the merged counts per key, like scheduler.run_jobs
+
+    `worker` and `initializer` must be module-level functions. `processes`
+    local workers are started next to the coordinator. `on_result(key,
+    counts)` is called here for every finished chunk. With `lease` set, a
+    job that takes longer than `lease` seconds is given to another worker.
+    Binding anything but a loopback address requires a key other than the
+    public default, e.g. from WBC_AUTHKEY.
+    """
+    if not jobs:
+        return {}
+    host, port = address
+    if authkey == DEFAULT_AUTHKEY and not is_loopback(host):
+        raise ValueError(f"Refusing to serve on {host or '0.0.0.0'}:{port} with the default authkey, "
+                         "set WBC_AUTHKEY to a secret shared by the workers")
+    worker_module = sys.modules[worker.__module__]
+    task = ("task", reference(worker), initializer and reference(initializer), initargs,
+            source_hash(worker_module.__file__))
+    pending = collections.deque(jobs)
+    available = threading.Condition()
+    finished = threading.Event()
+    results = queue.Queue()
+
+    # Local workers are forked before the listening socket exists, so that closing it here really
+    # closes the port, and before any thread of the coordinator
+    local_address = ("127.0.0.1" if host in ("0.0.0.0", "") else host, port)
+    listening, closed = Event(), Event()
+    local = [Process(target=_work_locally, args=(local_address, authkey, listening, closed))
+             for _ in range(processes)]
+    for process in local:
+        process.start()
+    listener = None
+
+    def serve(conn):
+        job = None
+        try:
+            conn.send(task)
+            while True:
+                with available:
+                    while not pending and not finished.is_set():
+                        available.wait()
+                    if finished.is_set():
+                        conn.send(("stop",))
+                        return
+                    job = pending.popleft()
+                conn.send(("job", job))
+                if lease is not None and not conn.poll(lease):
+                    raise TimeoutError(f"no answer within {lease} s")
+                kind, payload = conn.recv()
+                results.put((kind, job, payload))
+                job = None
+        except (EOFError, OSError):
+            # The worker went away (or its lease expired): its job goes back in front of the queue
+            if job is not None:
+                with available:
+                    pending.appendleft(job)
+                    available.notify()
+        finally:
+            conn.close()
+
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, ConnectionError):
+                # Failed handshake, e.g. the wake-up connection below
+                if finished.is_set():
+                    return
+                continue
+            except OSError:
+                return
+            if finished.is_set():
+                conn.close()
+                return
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    totals = {}
+    try:
+        # Room for every worker connecting at once, the default backlog of 1 drops their SYNs
+        listener = Listener(address, backlog=BACKLOG, authkey=authkey)
+        listening.set()
+        threading.Thread(target=accept, daemon=True).start()
+        for _ in range(len(jobs)):
+            kind, job, payload = results.get()
+            if kind == "error":
+                raise RuntimeError(f"Job {job} failed on a worker:\n{payload}")
+            key, counts = payload
+            scheduler.merge_counts(totals.setdefault(key, {}), counts)
+            if on_result is not None:
+                on_result(key, counts)
+    finally:
+        with available:
+            finished.set()
+            available.notify_all()
+        closed.set()
+        listening.set()
+        if listener is not None:
+            # Wake up the accept loop with a plain connection whose handshake fails at once, so
+            # nothing here waits on it; connections still queued are reset when the listener closes
+            try:
+                socket.create_connection(local_address, timeout=1.0).close()
+            except OSError:
+                pass
+            listener.close()
+        for process in local:
+            process.join(JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+    return totals
+
+
+def _serve_session(conn):
+    _, target, initializer, initargs, expected = conn.recv()
+    module, worker = resolve(target)
+    if source_hash(module.__file__) != expected:
+        print(f"{target} differs from the coordinator's, not taking its jobs", file=sys.stderr)
+        return False
+    if initializer:
+        resolve(initializer)[1](*initargs)
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            return True
+        try:
+            result = worker(message[1])
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+        else:
+            conn.send(("result", result))
+
+
+def _work_locally(address, authkey, listening, closed):
+    # Local worker of run_jobs: connects once the coordinator listens, for a single session,
+    # and gives up as soon as the coordinator has closed the port
+    listening.wait()
+    while not closed.is_set():
+        try:
+            conn = Client(address, authkey=authkey)
+        except (EOFError, OSError):
+            time.sleep(0.1)
+            continue
+        try:
+            _serve_session(conn)
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+        return
+
+
+def work(address, authkey=AUTHKEY, wait=60.0):
+    """Pull jobs from the coordinator at `address`, until it has been unreachable for `wait` seconds"""
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+        except OSError:
+            if time.monotonic() > deadline:
+                return
+            time.sleep(1.0)
+            continue
+        try:
+            if not _serve_session(conn):
+                return
+        except (EOFError, OSError):
+            # The coordinator stopped or dropped this worker; wait for the next sweep
+            pass
+        finally:
+            conn.close()
+        deadline = time.monotonic() + wait
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="pull jobs from a coordinator")
+    worker.add_argument("address", help="host:port of the coordinator")
+    worker.add_argument("--processes", type=int, default=cpu_count())
+    worker.add_argument("--wait", type=float, default=60.0,
+                        help="seconds to keep trying to reach a coordinator before exiting")
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.address)
+    processes = [Process(target=work, args=(address,), kwargs={"wait": args.wait}) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Pure-NumPy engine for the 4-qubit state preparation circuit of SenderProgram.run
+
+Instead of building one qubit group at a time through NetQASM and NetSquid,
+all groups of a depolarization value are simulated at once as a batch of
+state-vector trajectories. Gate noise follows the generic NetSquid qdevice:
+after every CNOT, each of the two qubits is independently depolarized with
+probability `two_qubit_gate_depolar_prob` (single-qubit gates are noiseless).
+"""
+import numpy as np
+
+from wbc import cache, seeding
+from wbc.circuit import CIRCUIT
+
+# Qubits teleported by the sender: q2 goes to Receiver0, q3 to Receiver1
+TELEPORTED = (2, 3)
+NUM_QUBITS = 4
+
+# Upper bound on the number of trajectories held in memory at once
+CHUNK_SIZE = 1 << 16
+
+
+def rotation(gate, n, d):
+    """Matrix of NetQASM's rot_X / rot_Z(n, d), a rotation by n * pi / 2^d"""
+    theta = n * np.pi / 2 ** d
+    c, s = np.cos(theta / 2), np.sin(theta / 2)
+    if gate == "rot_Z":
+        return np.array([[c - 1j * s, 0], [0, c + 1j * s]])
+    if gate == "rot_X":
+        return np.array([[c, -1j * s], [-1j * s, c]])
+    raise ValueError(f"Unknown rotation gate: {gate}")
+
+
+def _apply_single(psi, matrix, qubit):
+    axis = qubit + 1
+    return np.moveaxis(np.tensordot(matrix, psi, axes=([1], [axis])), 0, axis)
+
+
+def _apply_cnot(psi, control, target):
+    index = [slice(None)] * (NUM_QUBITS + 1)
+    index[control + 1] = 1
+    index = tuple(index)
+    # The control axis disappears from the slice, shifting later axes down by one
+    target_axis = target + 1 if target < control else target
+    psi[index] = np.flip(psi[index], axis=target_axis)
+
+
+def _apply_pauli(psi, rows, qubit, pauli):
+    # pauli: 1 = X, 2 = Y, 3 = Z (Y is applied as XZ, the global phase is irrelevant)
+    if pauli in (2, 3):
+        index = [rows] + [slice(None)] * NUM_QUBITS
+        index[qubit + 1] = 1
+        psi[tuple(index)] *= -1
+    if pauli in (1, 2):
+        psi[rows] = np.flip(psi[rows], axis=qubit + 1)
+
+
+def _depolarize(psi, qubit, p, rng, faults=None):
+    # With probability p the qubit is replaced by the maximally mixed state,
+    # i.e. a uniformly random Pauli (including the identity) is applied
+    # The Paulis are drawn for every row, so that each row's draws do not depend on the other rows
+    n = psi.shape[0]
+    hit = rng.random(n) < p
+    paulis = rng.integers(0, 4, size=n)
+    if faults is not None:
+        faults += hit
+    for pauli in (1, 2, 3):
+        rows = np.flatnonzero(hit & (paulis == pauli))
+        if rows.size:
+            _apply_pauli(psi, rows, qubit, pauli)
+
+
+def teleport_flips(p, size, rng, faults=None):
+    """Sample the computational-basis flips caused by teleport_send
+
+    The teleportation CNOT is executed on the sender's device. Only an X or Y
+    error on the sender's EPR half (probability p/2) turns into an X error on
+    the receiver's qubit; every other error only affects the phase. With
+    `faults` given, the number of depolarization events is added to it.
+    """
+    hit = rng.random(size) < p
+    if faults is not None:
+        faults += hit
+    return hit & (rng.integers(0, 4, size=size) % 3 != 0)
+
+
+def _simulate_chunk(p, n, rng, circuit, faults=None):
+    psi = np.zeros((n,) + (2,) * NUM_QUBITS, dtype=complex)
+    psi[(slice(None),) + (0,) * NUM_QUBITS] = 1
+    for gate, qubits, angle in circuit:
+        if gate == "cnot":
+            _apply_cnot(psi, *qubits)
+            if p > 0:
+                for q in qubits:
+                    _depolarize(psi, q, p, rng, faults)
+        else:
+            psi = _apply_single(psi, rotation(gate, *angle), qubits[0])
+
+    # Sample a joint measurement of all four qubits in the computational basis
+    probs = np.abs(psi.reshape(n, -1)) ** 2
+    cdf = np.cumsum(probs, axis=1)
+    u = rng.random(n) * cdf[:, -1]
+    pattern = np.minimum((cdf < u[:, None]).sum(axis=1), 2 ** NUM_QUBITS - 1)
+    shifts = np.arange(NUM_QUBITS - 1, -1, -1)
+    bits = ((pattern[:, None] >> shifts) & 1).astype(np.uint8)
+
+    if p > 0:
+        for q in TELEPORTED:
+            bits[:, q] ^= teleport_flips(p, n, rng, faults)
+    return bits
+
+
+def fault_sites(circuit=CIRCUIT):
+    """Depolarization events that can happen in one group: two per CNOT, one per teleportation"""
+    return 2 * sum(1 for gate in circuit if gate[0] == "cnot") + len(TELEPORTED)
+
+
+def _chunks(num_groups, rng):
+    """(first group, groups, generator) of every chunk, whole trials per chunk for seeding.TrialStreams"""
+    if not isinstance(rng, seeding.TrialStreams):
+        return [(start, min(CHUNK_SIZE, num_groups - start), rng) for start in range(0, num_groups, CHUNK_SIZE)]
+    if not len(rng):
+        return []
+    groups = num_groups // len(rng)
+    trials = max(1, CHUNK_SIZE // max(groups, 1))
+    return [(first * groups, min(trials, len(rng) - first) * groups, rng.split(first, first + trials))
+            for first in range(0, len(rng), trials)]
+
+
+def simulate_outcomes(p, num_groups, rng=None, circuit=CIRCUIT, faults=False):
+    """Simulate `num_groups` independent runs of the sender's circuit
+
+    Returns an array of shape (num_groups, 4) holding the measurement outcomes
+    of (q0, q1, q2, q3): q0 and q1 are the sender's own measurements, q2 and
+    q3 what Receiver0 and Receiver1 measure on their teleported qubit. With
+    `faults` set, also returns how many of the `fault_sites` of every group
+    were depolarized. Counting them does not change the random draws. With a
+    seeding.TrialStreams `rng`, every trial simulates its equal share of the
+    groups from its own generator, still in one vectorized batch.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    counts = np.zeros(num_groups, dtype=np.int64)
+    chunks = [
+        _simulate_chunk(p, size, chunk_rng, circuit, counts[start:start + size] if faults else None)
+        for start, size, chunk_rng in _chunks(num_groups, rng)
+    ]
+    outcomes = np.concatenate(chunks) if chunks else np.zeros((0, NUM_QUBITS), dtype=np.uint8)
+    return (outcomes, counts) if faults else outcomes
+
+
+def _depolarize_density(rho, qubit, p):
+    # rho -> (1 - p) rho + p * (Tr_qubit rho) (x) I/2, on a (2,) * 8 tensor
+    row, col = qubit, qubit + NUM_QUBITS
+    traced = np.trace(rho, axis1=row, axis2=col) / 2
+    mixed = np.moveaxis(np.multiply.outer(traced, np.eye(2)), (-2, -1), (row, col))
+    return (1 - p) * rho + p * mixed
+
+
+def outcome_distribution(p, circuit=CIRCUIT):
+    """Exact joint distribution of the (q0, q1, q2, q3) outcomes
+
+    The circuit is evolved as a 16x16 density matrix with the same noise as
+    `simulate_outcomes`. Entry k of the returned array is the probability of
+    the bit pattern q0 q1 q2 q3 = k written in binary (q0 most significant).
+    """
+    dim = 2 ** NUM_QUBITS
+    rho = np.zeros((dim, dim), dtype=complex)
+    rho[0, 0] = 1
+    rho = rho.reshape((2,) * (2 * NUM_QUBITS))
+    for gate, qubits, angle in circuit:
+        if gate == "cnot":
+            control, target = qubits
+            for offset in (0, NUM_QUBITS):
+                index = [slice(None)] * (2 * NUM_QUBITS)
+                index[control + offset] = 1
+                index = tuple(index)
+                # The control axis disappears from the slice, shifting later axes down by one
+                target_axis = target + offset - (1 if control < target else 0)
+                rho[index] = np.flip(rho[index], axis=target_axis)
+            if p > 0:
+                for q in qubits:
+                    rho = _depolarize_density(rho, q, p)
+        else:
+            matrix = rotation(gate, *angle)
+            rho = np.moveaxis(np.tensordot(matrix, rho, axes=([1], [qubits[0]])), 0, qubits[0])
+            rho = np.moveaxis(
+                np.tensordot(matrix.conj(), rho, axes=([1], [qubits[0] + NUM_QUBITS])),
+                0, qubits[0] + NUM_QUBITS,
+            )
+
+    probs = np.real(np.diagonal(rho.reshape(dim, dim))).reshape((2,) * NUM_QUBITS)
+    # Teleportation flips q2 and q3 in the computational basis with probability p/2
+    for q in TELEPORTED:
+        probs = (1 - p / 2) * probs + p / 2 * np.flip(probs, axis=q)
+    probs = np.clip(probs.reshape(dim), 0, None)
+    return probs / probs.sum()
+
+
+def cached_outcome_distribution(p, circuit=CIRCUIT):
+    """`outcome_distribution`, computed once per circuit and noise setting and kept on disk"""
+    key = {
+        "circuit": circuit,
+        "teleported": TELEPORTED,
+        "two_qubit_gate_depolar_prob": float(p),
+        "single_qubit_gate_depolar_prob": 0.0,
+    }
+    return np.array(cache.cached("outcome_distribution", key, lambda: outcome_distribution(p, circuit).tolist()))
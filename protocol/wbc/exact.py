@@ -0,0 +1,193 @@
+"""Exact failure probabilities of the three strategies
+
+The outcome of a trial only depends on how many qubit groups fall into each
+outcome class (e.g. indices_0011 / mixed / 1100 for the faulty sender) and on
+whether the check sets built from them pass the receivers' checks. Summing
+the receivers' decisions over the multinomial distribution of those class
+counts gives the failure probability without any sampling noise.
+"""
+import math
+
+import numpy as np
+
+from wbc import engine, models
+
+
+def _log_factorials(n):
+    return np.concatenate([[0.0], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def binom_pmf(n, p, log_factorials=None):
+    """Binomial(n, p) probabilities of k = 0..n"""
+    if log_factorials is None:
+        log_factorials = _log_factorials(n)
+    k = np.arange(n + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_p = np.where(k == 0, 0.0, k * np.log(p))
+        log_q = np.where(k == n, 0.0, (n - k) * np.log1p(-p))
+        log_pmf = log_factorials[n] - log_factorials[k] - log_factorials[n - k] + log_p + log_q
+    return np.exp(log_pmf)
+
+
+def binom_pmf_at(num_trials, k, p, log_factorials):
+    """Binomial(n, p) probabilities of k for every n in `num_trials` (0 where n < k)"""
+    n = np.asarray(num_trials)
+    valid = n >= k
+    rest = np.where(valid, n - k, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_p = k * np.log(p) if k > 0 else 0.0
+        log_q = np.where(rest == 0, 0.0, rest * np.log1p(-p))
+        log_pmf = (log_factorials[np.where(valid, n, k)] - log_factorials[k] - log_factorials[rest]
+                   + log_p + log_q)
+    return np.where(valid, np.exp(log_pmf), 0.0)
+
+
+def binom_sf_by_trials(m, k, p, log_factorials):
+    """P(Binomial(n, p) > k) for n = 0..m
+
+    Built up over n without summing a pmf per n: one more trial only adds
+    P(X_n = k) * p, so the survival function is a cumulative sum of positive
+    terms and stays accurate in the tail.
+    """
+    if k < 0:
+        return np.ones(m + 1)
+    steps = p * binom_pmf_at(np.arange(m), k, p, log_factorials)
+    return np.concatenate([[0.0], np.cumsum(steps)])
+
+
+def _by_check_length(failed, num_states, lengths):
+    """`failed(k)` for every check set length k in `lengths`
+
+    The receivers only compare a check set's length with T = ceil(MU * m),
+    so evaluating the rule at k = 0 and k = T covers every length.
+    """
+    T = math.ceil(models.MU * num_states)
+    return np.where(lengths >= T, failed(T), failed(0))
+
+
+def _ratio(a, b):
+    return a / b if b > 0 else 0.0
+
+
+def _joint_events(p_both, p_first, p_second):
+    # Probabilities of (first, second) in {T, F}^2 from P(both), P(first), P(second)
+    return {
+        (True, True): p_both,
+        (True, False): p_first - p_both,
+        (False, True): p_second - p_both,
+        (False, False): 1 - p_first - p_second + p_both,
+    }
+
+
+def no_faulty(dist, num_states):
+    m = num_states
+    lf = _log_factorials(m)
+    failure = 0.0
+    for x_s in (0, 1):
+        cls = dist[x_s, x_s]
+        a = cls.sum()
+        cond = cls / a if a > 0 else cls
+        n = np.arange(m + 1)
+        pmf = binom_pmf(m, a, lf)
+        # Every index of the check set has to pass Receiver0's (q2) and Receiver1's (q3) check
+        events = _joint_events(
+            cond[1 - x_s, 1 - x_s] ** n,
+            cond[1 - x_s, :].sum() ** n,
+            cond[:, 1 - x_s].sum() ** n,
+        )
+        for (ok0, ok1), prob in events.items():
+            failed = _by_check_length(lambda k: models.no_faulty_failed(
+                m,
+                {"x_s": x_s},
+                {"y0": models.receiver_decision(x_s, k, ok0, m)},
+                {"y1": models.receiver1_output(models.receiver_decision(x_s, k, ok1, m), x_s, k, m)},
+            ), m, n)
+            failure += 0.5 * np.sum(pmf * np.clip(prob, 0, None) * failed)
+    return failure
+
+
+def s_faulty(dist, num_states):
+    m = num_states
+    lf = _log_factorials(m)
+    x_r0, x_r1 = 0, 1
+    class_0011 = dist[0, 0]
+    class_mixed = dist[0, 1] + dist[1, 0]
+    class_1100 = dist[1, 1]
+    a00, amix = class_0011.sum(), class_mixed.sum()
+
+    T = math.ceil(models.S_FAULTY_RATIO * m)
+    Q = T - math.ceil(models.LAMBDA * T) + 1
+
+    # P(l1 >= T - Q, l2 >= Q, l3 >= T), summing over l1 the probability that l2 ~ Binomial(m - l1, r)
+    # lies in [Q, m - l1 - T]: P(l2 >= Q) + P(l3 < T) - 1, with l3 = m - l1 - l2 ~ Binomial(m - l1, 1 - r)
+    r = _ratio(amix, 1 - a00)
+    rest = np.arange(m + 1)
+    between = binom_sf_by_trials(m, Q - 1, r, lf) + binom_sf_by_trials(m, T - 1, 1 - r, lf) - 1
+    between = np.where(rest >= Q + T, np.clip(between, 0, None), 0.0)
+    l1 = np.arange(T - Q, m + 1)
+    applicable = float(np.sum(binom_pmf(m, a00, lf)[l1] * between[m - l1]))
+
+    # Given the strategy applies, the chosen indices are i.i.d. within their class
+    ok0 = (_ratio(class_0011[1 - x_r0, :].sum(), a00) ** (T - Q)
+           * _ratio(class_mixed[1 - x_r0, :].sum(), amix) ** Q)
+    ok1 = _ratio(class_1100[:, 1 - x_r1].sum(), class_1100.sum()) ** T
+
+    failure = 0.0
+    for e0, p0 in ((True, ok0), (False, 1 - ok0)):
+        for e1, p1 in ((True, ok1), (False, 1 - ok1)):
+            y1_tilde = models.receiver_decision(x_r1, T, e1, m)
+            failed = models.s_faulty_failed(
+                m,
+                {"x_r0": x_r0, "x_r1": x_r1},
+                {"y0": models.receiver_decision(x_r0, T, e0, m)},
+                {"y1": models.receiver1_output(y1_tilde, x_r0, T, m)},
+            )
+            failure += applicable * p0 * p1 * failed
+    failure += (1 - applicable) * models.s_faulty_failed(m, {"failed_to_apply_strategy": True}, {}, {})
+    return failure
+
+
+def r0_faulty(dist, num_states):
+    m = num_states
+    lf = _log_factorials(m)
+    x_s = 0
+    sigma = dist[x_s, x_s]
+    a = sigma.sum()
+    cond = sigma / a if a > 0 else sigma
+    T = math.ceil(models.MU * m)
+
+    failure = 0.0
+    n = np.arange(m + 1)
+    pmf = binom_pmf(m, a, lf)
+    # Receiver0 can forward T indices when (m - n) + #{sigma_s indices with q2 = 0} >= T, i.e. when
+    # at most m - T of the n indices have q2 = 1
+    fwd_ok = 1 - binom_sf_by_trials(m, m - T, 1 - cond[0, :].sum(), lf)
+    # Receiver1's check on sigma_s: every q3 differs from x_s
+    p_e1 = cond[:, 1 - x_s].sum() ** n
+    # Joint P(fwd_ok, e1): given e1, q2 = 0 with probability P(q2 = 0 | q3 = 1 - x_s)
+    q2_given = _ratio(cond[0, 1 - x_s], cond[:, 1 - x_s].sum())
+    both = p_e1 * (1 - binom_sf_by_trials(m, m - T, 1 - q2_given, lf))
+
+    for (f_ok, e1), prob in _joint_events(both, fwd_ok, p_e1).items():
+        sigma_r1_len = T if f_ok else 0
+        failed = _by_check_length(lambda k: models.r0_faulty_failed(
+            m,
+            {"x_s": x_s},
+            {"sigma_r1_len": sigma_r1_len},
+            {"y1": models.receiver1_output(models.receiver_decision(x_s, k, e1, m), x_s, sigma_r1_len, m)},
+        ), m, n)
+        failure += np.sum(pmf * np.clip(prob, 0, None) * failed)
+    return float(failure)
+
+
+EXACT_MODELS = {
+    "no_faulty": no_faulty,
+    "s_faulty": s_faulty,
+    "r0_faulty": r0_faulty,
+}
+
+
+def failure_probability(model, p, num_states):
+    """Exact failure probability of `model` at two-qubit depolarization `p` with m = num_states"""
+    dist = engine.cached_outcome_distribution(p).reshape((2,) * engine.NUM_QUBITS)
+    return float(min(max(EXACT_MODELS[model](dist, num_states), 0.0), 1.0))
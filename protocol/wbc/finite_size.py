@@ -0,0 +1,152 @@
+"""Failure rate against the number of states m, from one simulation per trial
+
+Usage, from the protocol/ directory:
+
+    python -m wbc.finite_size --model no_faulty --sizes 40 80 140 280 --depolar 0.0001 0.001
+
+The check sets, the length checks and the consistency checks of every
+strategy are deterministic functions of the per-index outcomes of the
+sender's circuit (see wbc.models). The qubit groups are i.i.d., so the
+first m groups of a run with m_max groups are distributed exactly like a run
+with m groups. Every trial therefore simulates max(sizes) groups once and
+evaluates the protocol on the first m of them for every requested m. The
+protocol's own coin flips are the same for every m of a trial, which makes
+the curves smoother than separate sweeps would.
+
+The failure rates of different m in one trial are correlated, but each one
+is an unbiased estimate over independent trials. With the importance engine,
+a trial's fault count and weight are taken over the prefix as well, with the
+biased depolarization chosen for m_max. Results go to --output, one row per
+depolarization value and m.
+"""
+import argparse
+import csv
+import time
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from wbc import engine, importance, models, scheduler, seeding
+
+STRATEGIES = ["no_faulty", "s_faulty", "r0_faulty"]
+ENGINES = ("numpy", "distribution", "importance")
+SIZES = [40, 80, 140, 200, 280]
+DEPOLAR_VALUES = [0.000001, 0.00001, 0.0001, 0.001, 0.01]
+
+
+def simulate_groups(engine_name, p, num_groups, rng):
+    """Outcomes of `num_groups` groups, and the fault count of each group for the importance engine"""
+    if engine_name == "numpy":
+        return engine.simulate_outcomes(p, num_groups, rng), None
+    if engine_name == "distribution":
+        patterns = rng.choice(2 ** engine.NUM_QUBITS, size=num_groups, p=engine.cached_outcome_distribution(p))
+        shifts = np.arange(engine.NUM_QUBITS - 1, -1, -1)
+        return ((patterns[:, None] >> shifts) & 1).astype(np.uint8), None
+    q = importance.biased_prob(p, num_groups * engine.fault_sites())
+    return engine.simulate_outcomes(q, num_groups, rng, faults=True)
+
+
+def run_prefixes(engine_name, model, p, sizes, rng):
+    """(m, (sender, receiver0, receiver1)) for every m in `sizes`, all from one trial of max(sizes) groups"""
+    m_max = max(sizes)
+    outcomes, faults = simulate_groups(engine_name, p, m_max, rng)
+    if faults is not None:
+        q = importance.biased_prob(p, m_max * engine.fault_sites())
+        faults = np.cumsum(faults)
+    program = models.MODELS[model]
+    # Every m sees the same protocol coins
+    state = rng.bit_generator.state
+    results = []
+    for m in sizes:
+        rng.bit_generator.state = state
+        sender, receiver0, receiver1 = program(outcomes[:m], rng)
+        if faults is not None:
+            sender.update({"faults": int(faults[m - 1]), "weight": importance.weight(faults[m - 1], m, p, q),
+                           "baseline": importance.baseline(model, p, m)})
+        results.append((m, (sender, receiver0, receiver1)))
+    return results
+
+
+# Model, engine, sizes and base seed, handed to every worker process by the pool initializer
+SETTINGS = {}
+
+
+def set_settings(settings):
+    SETTINGS.update(settings)
+
+
+def run_chunk(job):
+    """Counts of one chunk of trials, with "failures_<m>" (and weighted failures) for every m"""
+    idx, p, start, num_trials = job
+    model, engine_name, sizes, seed = SETTINGS["model"], SETTINGS["engine"], SETTINGS["sizes"], SETTINGS["seed"]
+    failed = models.FAILURE_RULES[model]
+    counts = {"trials": num_trials}
+    start_time = time.time()
+    rng = np.random.default_rng()
+    for trial in range(start, start + num_trials):
+        if seed is not None:
+            rng = np.random.default_rng(seeding.trial_seed(model, p, trial, seed))
+        for m, result in run_prefixes(engine_name, model, p, sizes, rng):
+            failure = failed(m, *result)
+            scheduler.merge_counts(counts, {f"failures_{m}": int(failure)})
+            for name, value in importance.trial_counts(result[0], failure).items():
+                scheduler.merge_counts(counts, {f"{name}_{m}": value})
+    counts["time"] = time.time() - start_time
+    return (idx, p), counts
+
+
+def counts_of_size(counts, m):
+    """Counts of one m, in the format of wbc.scheduler"""
+    trials = counts["trials"]
+    result = {"trials": trials, "successes": trials - counts[f"failures_{m}"], "failures": counts[f"failures_{m}"]}
+    if f"weighted_failures_{m}" in counts:
+        result.update({"weighted_failures": counts[f"weighted_failures_{m}"],
+                       "weighted_failures_sq": counts[f"weighted_failures_sq_{m}"]})
+    return result
+
+
+def run(model, engine_name, sizes, depolar_values, num_trials, chunk_size=50, seed=0, processes=None):
+    """Merged counts of every (index, p) key, see `run_chunk`"""
+    sizes = sorted(set(sizes))
+    jobs = scheduler.make_jobs(depolar_values, num_trials, chunk_size)
+    settings = {"model": model, "engine": engine_name, "sizes": sizes, "seed": seed}
+    return scheduler.run_jobs(run_chunk, jobs, processes=processes or cpu_count(),
+                              initializer=set_settings, initargs=(settings,))
+
+
+def write_results(path, model, sizes, totals):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Model", "Depolar_Prob", "Num_States", "Trials", "Failures", "Failure_Rate", "Std_Error"])
+        for (idx, p), counts in sorted(totals.items()):
+            for m in sorted(set(sizes)):
+                size_counts = counts_of_size(counts, m)
+                writer.writerow([model, p, m, size_counts["trials"], size_counts["failures"],
+                                 *importance.estimate(size_counts)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="no_faulty", choices=STRATEGIES)
+    parser.add_argument("--engine", default="numpy", choices=ENGINES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="values of m (NUM_STATES)")
+    parser.add_argument("--depolar", nargs="+", type=float, default=DEPOLAR_VALUES)
+    parser.add_argument("--trials", type=int, default=500)
+    parser.add_argument("--chunk", type=int, default=50, help="trials per scheduled job")
+    parser.add_argument("--seed", type=int, default=0, help="base of the per-trial seeds of wbc.seeding")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default="finite_size.csv")
+    args = parser.parse_args(argv)
+
+    totals = run(args.model, args.engine, args.sizes, args.depolar, args.trials, args.chunk, args.seed,
+                 args.processes)
+    write_results(args.output, args.model, args.sizes, totals)
+    for (idx, p), counts in sorted(totals.items()):
+        rates = ", ".join(f"m={m}: {importance.estimate(counts_of_size(counts, m))[0]:.3f}"
+                          for m in sorted(set(args.sizes)))
+        print(f"p={p:.8f}  {rates}")
+    print(f"\nFailure rates of {len(args.sizes)} sizes x {len(args.depolar)} values written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
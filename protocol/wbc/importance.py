@@ -0,0 +1,110 @@
+"""Importance sampling of the gate faults for low depolarization values
+
+At small p most trials see no depolarization event at all, and those trials
+fail exactly as often as the noiseless protocol does. Plain Monte Carlo
+spends almost all its trials re-estimating that error-free failure rate, so
+the small part caused by noise drowns in its sampling error.
+
+The "importance" engine splits the failure probability on whether a trial
+has any fault:
+
+    P(fail) = (1 - p)^N * P0 + E_p[fail * 1{K > 0}]
+
+where N is the number of fault sites of a trial (both qubits of every CNOT
+of the sender's circuit and the sender's half of every teleportation), K
+the number of depolarization events and P0 the failure probability without
+noise, which wbc.exact gives without sampling. The second term is sampled
+with the CNOTs depolarized at a biased probability q > p, chosen so that a
+trial sees FAULTS_PER_TRIAL events on average, and every trial is weighted
+by its likelihood ratio
+
+    w = (p / q)^K * ((1 - p) / (1 - q))^(N - K)
+
+Each trial's estimate (1 - p)^N * P0 + w * fail * 1{K > 0} is unbiased, so
+their mean and standard error give the failure rate and its uncertainty.
+"""
+import functools
+import math
+
+import numpy as np
+
+from wbc import engine, exact, models, seeding
+
+# Mean number of depolarization events per trial under the biased distribution
+FAULTS_PER_TRIAL = 1.0
+
+
+def biased_prob(p, sites, faults_per_trial=FAULTS_PER_TRIAL):
+    """Depolarization probability to sample with: p, raised to give `faults_per_trial` events on average"""
+    if p <= 0:
+        return 0.0
+    return max(p, min(faults_per_trial / sites, 0.5))
+
+
+def log_weight(faults, sites, p, q):
+    """Log-likelihood ratio of `faults` events out of `sites` under p against q"""
+    if p == q:
+        return np.zeros_like(faults, dtype=float)
+    return faults * (math.log(p) - math.log(q)) + (sites - faults) * (math.log1p(-p) - math.log1p(-q))
+
+
+@functools.lru_cache(maxsize=None)
+def baseline(model, p, num_states):
+    """(1 - p)^N * P0: the failure probability contributed by the trials without any fault"""
+    sites = num_states * engine.fault_sites()
+    return math.exp(sites * math.log1p(-p)) * exact.failure_probability(model, 0.0, num_states)
+
+
+def weight(faults, num_states, p, q):
+    """Likelihood ratio of a trial with `faults` events, or 0 without any since `baseline` covers those"""
+    if faults == 0:
+        return 0.0
+    return float(math.exp(log_weight(faults, num_states * engine.fault_sites(), p, q)))
+
+
+def run_importance(model, p, num_states, num_times, rng=None, faults_per_trial=FAULTS_PER_TRIAL):
+    """Like models.run_numpy, with biased gate faults and each trial's weight in the sender's result
+
+    The sender's result gets "faults" (K), "weight" (w, or 0 when K = 0) and
+    "baseline" ((1 - p)^N * P0), which `trial_counts` combines with the
+    trial's failure.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    program = models.MODELS[model]
+    sites = num_states * engine.fault_sites()
+    q = biased_prob(p, sites, faults_per_trial)
+    outcomes, faults = engine.simulate_outcomes(q, num_states * num_times, rng, faults=True)
+    faults = faults.reshape(num_times, num_states).sum(axis=1)
+
+    results = []
+    for k in range(num_times):
+        sender, receiver0, receiver1 = program(outcomes[k * num_states:(k + 1) * num_states],
+                                                   seeding.trial_generator(rng, k))
+        sender.update({"faults": int(faults[k]), "weight": weight(faults[k], num_states, p, q),
+                       "baseline": baseline(model, p, num_states)})
+        results.append((sender, receiver0, receiver1))
+    return [list(party) for party in zip(*results)] if results else [[], [], []]
+
+
+def trial_counts(sender, failed):
+    """Weighted-failure counts of one trial, to be summed like the other counts (empty if it has no weight)"""
+    if "weight" not in sender:
+        return {}
+    value = sender["baseline"] + sender["weight"] * bool(failed)
+    return {"weighted_failures": value, "weighted_failures_sq": value * value}
+
+
+def estimate(counts):
+    """(failure rate, standard error) of summed counts, weighted if they come from the importance engine"""
+    trials = counts.get("trials", 0)
+    if not trials:
+        return float("nan"), float("nan")
+    if "weighted_failures" not in counts:
+        rate = counts["failures"] / trials
+        return rate, math.sqrt(rate * (1 - rate) / trials)
+    rate = counts["weighted_failures"] / trials
+    if trials < 2:
+        return rate, float("nan")
+    variance = max(counts["weighted_failures_sq"] / trials - rate ** 2, 0.0) * trials / (trials - 1)
+    return rate, math.sqrt(variance / trials)
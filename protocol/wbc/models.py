@@ -0,0 +1,275 @@
+"""Classical mirrors of the three application.py variants
+
+Given the per-index measurement outcomes of the sender's circuit, the rest of
+the WBC(3,1) protocol is classical: check sets, length checks and consistency
+checks only depend on those outcomes. The functions below reproduce the
+programs of each strategy and return the same result dicts, so the outcomes
+simulated by the NumPy engine can be fed to the existing classifiers.
+"""
+import math
+
+import numpy as np
+
+from wbc import engine, seeding
+
+# Parameters of the WBC, as in Receiver0Program / Receiver1Program
+MU = 0.3
+LAMBDA = 0.94
+# Check set length targeted by the faulty sender (Appendix B.1)
+S_FAULTY_RATIO = 0.272
+
+
+def receiver_decision(x_s, sigma_len, all_differ, num_states):
+    """Check phase of an honest receiver, returns the accepted bit or "abort"
+
+    `all_differ` tells whether every measured qubit in the check set differs from x_s.
+    """
+    T = math.ceil(MU * num_states)
+    if sigma_len >= T and all_differ:
+        return x_s
+    return "abort"
+
+
+def receiver_check(x_s, sigma_s, bits, num_states):
+    """`receiver_decision` where `bits` holds the receiver's outcome for every index"""
+    return receiver_decision(x_s, len(sigma_s), bool(np.all(bits[sigma_s] != x_s)), num_states)
+
+
+def receiver1_output(y1_tilde, x0_fwd, fwd_len, num_states):
+    """Final decision of Receiver1 given the forwarded bit and check set length"""
+    T = math.ceil(MU * num_states)
+    confusion_ok = x0_fwd != y1_tilde and x0_fwd != "abort" and y1_tilde != "abort"
+    length_ok = fwd_len >= T
+    consistency_ok = False
+    if length_ok:
+        required = math.ceil(LAMBDA * T + fwd_len - T)
+        # Every dummy qubit is freshly initialised and measured, so it always reads 0
+        mismatch = fwd_len if x0_fwd != 0 else 0
+        consistency_ok = mismatch >= required
+    return x0_fwd if (confusion_ok and length_ok and consistency_ok) else y1_tilde
+
+
+def no_faulty(outcomes, rng):
+    """All three parties are honest"""
+    num_states = len(outcomes)
+    x_s = int(rng.choice([0, 1]))
+    sigma_s = np.flatnonzero((outcomes[:, 0] == x_s) & (outcomes[:, 1] == x_s))
+
+    y0 = receiver_check(x_s, sigma_s, outcomes[:, 2], num_states)
+    y1_tilde = receiver_check(x_s, sigma_s, outcomes[:, 3], num_states)
+    y1 = receiver1_output(y1_tilde, x_s, len(sigma_s), num_states)
+    return {"x_s": x_s}, {"y0": y0}, {"y1": y1}
+
+
+def s_faulty(outcomes, rng):
+    """The sender sends conflicting bits, following Appendix B.1 of Guba et al."""
+    num_states = len(outcomes)
+    x_r0, x_r1 = 0, 1
+    bits = outcomes[:, 0] * 2 + outcomes[:, 1]
+    indices_0011 = np.flatnonzero(bits == 0)
+    indices_1100 = np.flatnonzero(bits == 3)
+    indices_mixed = np.flatnonzero((bits == 1) | (bits == 2))
+    counts = {"l1": len(indices_0011), "l2": len(indices_mixed), "l3": len(indices_1100)}
+
+    T = math.ceil(S_FAULTY_RATIO * num_states)
+    Q = T - math.ceil(LAMBDA * T) + 1
+    if not (len(indices_0011) >= T - Q and len(indices_mixed) >= Q and len(indices_1100) >= T):
+        # Strategy cannot be applied, receivers only get empty check sets
+        empty = np.zeros(0, dtype=int)
+        y1_tilde = receiver_check(x_r1, empty, outcomes[:, 3], num_states)
+        return (
+            {"failed_to_apply_strategy": True, **counts},
+            {"y0": receiver_check(x_r0, empty, outcomes[:, 2], num_states)},
+            {"y1": receiver1_output(y1_tilde, x_r0, 0, num_states)},
+        )
+
+    sigma_r0 = np.concatenate([indices_0011[:T - Q], indices_mixed[:Q]])
+    sigma_r1 = indices_1100[:T]
+    y0 = receiver_check(x_r0, sigma_r0, outcomes[:, 2], num_states)
+    y1_tilde = receiver_check(x_r1, sigma_r1, outcomes[:, 3], num_states)
+    y1 = receiver1_output(y1_tilde, x_r0, len(sigma_r0), num_states)
+    sender = {
+        "x_r0": x_r0,
+        "x_r1": x_r1,
+        "sigma_r0_len": len(sigma_r0),
+        "sigma_r1_len": len(sigma_r1),
+        **counts,
+    }
+    return sender, {"y0": y0}, {"y1": y1}
+
+
+def r0_faulty(outcomes, rng):
+    """Receiver0 forwards a forged check set, the sender always sends 0"""
+    num_states = len(outcomes)
+    x_s = 0
+    sigma_s = np.flatnonzero((outcomes[:, 0] == x_s) & (outcomes[:, 1] == x_s))
+
+    # Receiver0 measures every qubit and builds its local count lists
+    in_sigma = np.zeros(num_states, dtype=bool)
+    in_sigma[sigma_s] = True
+    indices_xx10 = np.flatnonzero((outcomes[:, 2] == 1) & ~in_sigma)
+    indices_xx0x = np.flatnonzero(outcomes[:, 2] == 0)
+    T = math.ceil(MU * num_states)
+    if len(indices_xx10) >= T:
+        sigma_r1 = indices_xx10[:T]
+    elif len(indices_xx10) + len(indices_xx0x) >= T:
+        sigma_r1 = np.concatenate([indices_xx10, indices_xx0x[:(T - len(indices_xx10))]])
+    else:
+        sigma_r1 = np.zeros(0, dtype=int)
+
+    y1_tilde = receiver_check(x_s, sigma_s, outcomes[:, 3], num_states)
+    y1 = receiver1_output(y1_tilde, x_s, len(sigma_r1), num_states)
+    receiver0 = {"sigma_r1_len": len(sigma_r1), "l1": len(indices_xx10), "l2": len(indices_xx0x)}
+    return {"x_s": x_s, "len_sigma": len(sigma_s)}, receiver0, {"y1": y1}
+
+
+def no_faulty_failed(num_states, sender, receiver0, receiver1):
+    """Failure rule of simulation_nofaulty.py: both receivers must output x_s"""
+    y0, y1 = receiver0.get("y0"), receiver1.get("y1")
+    if y0 == "abort" or y1 == "abort":
+        return True
+    return not (y0 == y1 == sender.get("x_s"))
+
+
+def s_faulty_failed(num_states, sender, receiver0, receiver1):
+    """Failure rule of simulation_sfaulty.py: receivers must not accept different bits"""
+    if sender.get("failed_to_apply_strategy", False):
+        return True
+    y0, y1 = receiver0.get("y0"), receiver1.get("y1")
+    return y0 != y1 and y0 != "abort" and y1 != "abort"
+
+
+def r0_faulty_failed(num_states, sender, receiver0, receiver1):
+    """Failure rule of simulation_r0faulty.py: forged set too short, or Receiver1 misled"""
+    if receiver0.get("sigma_r1_len") < math.ceil(MU * num_states):
+        return True
+    return receiver1.get("y1") != sender.get("x_s")
+
+
+FAILURE_RULES = {
+    "no_faulty": no_faulty_failed,
+    "s_faulty": s_faulty_failed,
+    "r0_faulty": r0_faulty_failed,
+}
+
+
+MODELS = {
+    "no_faulty": no_faulty,
+    "s_faulty": s_faulty,
+    "r0_faulty": r0_faulty,
+}
+
+
+def run_numpy(model, p, num_states, num_times, rng=None):
+    """NumPy counterpart of squidasm.run.stack.run for one strategy
+
+    All `num_states * num_times` qubit groups are simulated in one vectorized
+    call, also when `rng` is a seeding.TrialStreams giving every trial its own
+    generator. The return value has the same layout as squidasm's run: one list of
+    per-trial result dicts for each of Sender, Receiver0 and Receiver1.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    program = MODELS[model]
+    outcomes = engine.simulate_outcomes(p, num_states * num_times, rng)
+    results = [program(outcomes[k * num_states:(k + 1) * num_states], seeding.trial_generator(rng, k))
+               for k in range(num_times)]
+    return _by_party(results)
+
+
+# A trial can also be described by how often each of the 16 (q0, q1, q2, q3)
+# patterns occurs, stored as counts[q0, q1, q2, q3]. Since the qubit groups are
+# i.i.d., the first k indices of an outcome class are a uniformly random subset
+# of it, so taking them is a multivariate hypergeometric draw over the class.
+
+def _take(class_counts, k, rng):
+    """(q2, q3) counts of the first k indices of an outcome class"""
+    return rng.multivariate_hypergeometric(class_counts.ravel(), k).reshape(class_counts.shape)
+
+
+def no_faulty_counts(counts, rng):
+    """`no_faulty` on pattern counts"""
+    num_states = int(counts.sum())
+    x_s = int(rng.choice([0, 1]))
+    sigma = counts[x_s, x_s]
+    sigma_len = int(sigma.sum())
+
+    y0 = receiver_decision(x_s, sigma_len, sigma[x_s, :].sum() == 0, num_states)
+    y1_tilde = receiver_decision(x_s, sigma_len, sigma[:, x_s].sum() == 0, num_states)
+    y1 = receiver1_output(y1_tilde, x_s, sigma_len, num_states)
+    return {"x_s": x_s}, {"y0": y0}, {"y1": y1}
+
+
+def s_faulty_counts(counts, rng):
+    """`s_faulty` on pattern counts"""
+    num_states = int(counts.sum())
+    x_r0, x_r1 = 0, 1
+    class_0011 = counts[0, 0]
+    class_mixed = counts[0, 1] + counts[1, 0]
+    class_1100 = counts[1, 1]
+    counts_out = {"l1": int(class_0011.sum()), "l2": int(class_mixed.sum()), "l3": int(class_1100.sum())}
+
+    T = math.ceil(S_FAULTY_RATIO * num_states)
+    Q = T - math.ceil(LAMBDA * T) + 1
+    if not (counts_out["l1"] >= T - Q and counts_out["l2"] >= Q and counts_out["l3"] >= T):
+        # Strategy cannot be applied, receivers only get empty check sets
+        y1_tilde = receiver_decision(x_r1, 0, True, num_states)
+        return (
+            {"failed_to_apply_strategy": True, **counts_out},
+            {"y0": receiver_decision(x_r0, 0, True, num_states)},
+            {"y1": receiver1_output(y1_tilde, x_r0, 0, num_states)},
+        )
+
+    sigma_r0 = _take(class_0011, T - Q, rng) + _take(class_mixed, Q, rng)
+    sigma_r1 = _take(class_1100, T, rng)
+    y0 = receiver_decision(x_r0, T, sigma_r0[x_r0, :].sum() == 0, num_states)
+    y1_tilde = receiver_decision(x_r1, T, sigma_r1[:, x_r1].sum() == 0, num_states)
+    y1 = receiver1_output(y1_tilde, x_r0, T, num_states)
+    sender = {"x_r0": x_r0, "x_r1": x_r1, "sigma_r0_len": T, "sigma_r1_len": T, **counts_out}
+    return sender, {"y0": y0}, {"y1": y1}
+
+
+def r0_faulty_counts(counts, rng):
+    """`r0_faulty` on pattern counts"""
+    num_states = int(counts.sum())
+    x_s = 0
+    sigma = counts[x_s, x_s]
+    sigma_len = int(sigma.sum())
+
+    xx10 = int(counts[:, :, 1].sum() - sigma[1].sum())
+    xx0x = int(counts[:, :, 0].sum())
+    T = math.ceil(MU * num_states)
+    sigma_r1_len = T if xx10 + xx0x >= T else 0
+
+    y1_tilde = receiver_decision(x_s, sigma_len, sigma[:, x_s].sum() == 0, num_states)
+    y1 = receiver1_output(y1_tilde, x_s, sigma_r1_len, num_states)
+    receiver0 = {"sigma_r1_len": sigma_r1_len, "l1": xx10, "l2": xx0x}
+    return {"x_s": x_s, "len_sigma": sigma_len}, receiver0, {"y1": y1}
+
+
+COUNT_MODELS = {
+    "no_faulty": no_faulty_counts,
+    "s_faulty": s_faulty_counts,
+    "r0_faulty": r0_faulty_counts,
+}
+
+
+def run_distribution(model, p, num_states, num_times, rng=None):
+    """Like `run_numpy`, but each trial is drawn as multinomial pattern counts
+
+    The outcome distribution is computed exactly once per depolarization value
+    and cached on disk (see engine.cached_outcome_distribution); it is read
+    once per call, for all `num_times` trials.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    program = COUNT_MODELS[model]
+    dist = engine.cached_outcome_distribution(p)
+    counts = rng.multinomial(num_states, dist, size=num_times)
+    counts = counts.reshape((num_times,) + (2,) * engine.NUM_QUBITS)
+    return _by_party([program(c, seeding.trial_generator(rng, k)) for k, c in enumerate(counts)])
+
+
+def _by_party(results):
+    # Per-trial (sender, r0, r1) tuples to squidasm's per-party result lists
+    return [list(party) for party in zip(*results)] if results else [[], [], []]
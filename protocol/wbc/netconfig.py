@@ -0,0 +1,96 @@
+"""In-memory variants of a network configuration
+
+The base config.yaml is parsed once, and every variant is a deep copy with
+some qdevice_cfg or link fields overridden. Variants are turned into SquidASM's
+StackNetworkConfig without going through temporary YAML files.
+"""
+import copy
+
+import yaml
+
+
+def load_config(path):
+    """Parse a network configuration file into a plain dict"""
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def with_qdevice(config, stacks=None, **overrides):
+    """Copy of `config` with qdevice_cfg fields overridden
+
+    Applies to every generic qdevice, or only to the stacks named in `stacks`.
+    """
+    variant = copy.deepcopy(config)
+    for stack in variant.get("stacks", []):
+        selected = stack.get("name") in stacks if stacks is not None else stack.get("qdevice_typ") == "generic"
+        if selected:
+            stack.setdefault("qdevice_cfg", {}).update(overrides)
+    return variant
+
+
+def _set_path(entry, path, value):
+    for key in path[:-1]:
+        entry = entry.setdefault(key, {})
+    entry[path[-1]] = value
+
+
+def with_parameters(config, parameters):
+    """Copy of `config` with the dotted `parameters` paths set to their values
+
+    A path starts with a selector followed by the (possibly nested) field:
+    - "qdevice.T1": qdevice_cfg of every generic stack
+    - "Receiver0.qdevice.T1": qdevice_cfg of one stack
+    - "link.typ", "link.cfg.fidelity": every quantum link
+    - "link.Sender-Receiver0.typ": the quantum link between two stacks
+    - "clink.typ", "clink.Sender-Receiver0.typ": the same for classical links
+    """
+    variant = copy.deepcopy(config)
+    stack_names = {stack.get("name") for stack in variant.get("stacks", [])}
+    for name, value in parameters.items():
+        parts = name.split(".")
+        if parts[0] == "qdevice" or (parts[0] in stack_names and parts[1:2] == ["qdevice"]):
+            field = parts[1:] if parts[0] == "qdevice" else parts[2:]
+            for stack in variant.get("stacks", []):
+                if stack.get("name") == parts[0] or (parts[0] == "qdevice" and stack.get("qdevice_typ") == "generic"):
+                    _set_path(stack.setdefault("qdevice_cfg", {}), field, value)
+        elif parts[0] in ("link", "clink"):
+            ends, field = None, parts[1:]
+            if "-" in parts[1]:
+                ends, field = set(parts[1].split("-")), parts[2:]
+            for link in variant.get(parts[0] + "s", []):
+                if ends is None or {link.get("stack1"), link.get("stack2")} == ends:
+                    _set_path(link, field, value)
+        else:
+            raise ValueError(f"Unknown network parameter {name!r}")
+    return variant
+
+
+# qdevice_cfg fields that make single-qubit gates or idle qubits noisy on a generic device
+SINGLE_QUBIT_NOISE = ("single_qubit_gate_depolar_prob", "T1", "T2")
+
+
+def noiseless_single_qubit(config, stacks):
+    """Whether the named stacks are generic qdevices without single-qubit gate or memory noise"""
+    for stack in config.get("stacks", []):
+        if stack.get("name") in stacks:
+            if stack.get("qdevice_typ") != "generic":
+                return False
+            qdevice_cfg = stack.get("qdevice_cfg") or {}
+            if any(qdevice_cfg.get(field) for field in SINGLE_QUBIT_NOISE):
+                return False
+    return True
+
+
+def stack_network_config(config):
+    """StackNetworkConfig built from a config dict, as StackNetworkConfig.from_file would"""
+    from squidasm.run.stack.config import StackNetworkConfig
+
+    return StackNetworkConfig(**copy.deepcopy(config))
+
+
+def depolarization_variants(config, values):
+    """{index: StackNetworkConfig} with two_qubit_gate_depolar_prob set to each value"""
+    return {
+        idx: stack_network_config(with_qdevice(config, two_qubit_gate_depolar_prob=float(p)))
+        for idx, p in enumerate(values)
+    }
@@ -0,0 +1,124 @@
+"""Run the sweeps of all three strategies on one shared worker pool
+
+Usage, from the protocol/ directory:
+
+    python -m wbc.orchestrator
+
+Every (strategy, depolarization value) pair is split into chunks of trials
+like in the simulation_<strategy>.py scripts, but all chunks go to a single
+pool. Each strategy's application.py is loaded from its own folder with its
+own config.yaml. Chunks are ordered by their measured cost, most expensive
+first, so that the cheap ones fill the gaps at the end of the sweep. The
+results of every strategy end up in one combined table.
+"""
+import csv
+import functools
+import os
+from multiprocessing import cpu_count
+
+from wbc import distributed, importance, netconfig, scheduler
+from wbc.simulation import PROTOCOL_DIR, application_constants, run_chunk, set_configs
+from wbc.store import ResultStore
+
+# Parameters
+STRATEGIES = ["no_faulty", "s_faulty", "r0_faulty"]
+DEPOLAR_VALUES = [0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1]
+NUM_STATES = 280
+TRIALS_PER_VALUE = {"no_faulty": 500, "s_faulty": 500, "r0_faulty": 20}
+TRIALS_PER_CHUNK = 25
+ENGINE = "squidasm"
+# Base seed of the per-trial seeds, see wbc.seeding (None leaves the generators unseeded)
+SEED = 0
+RESULTS_DB = os.path.join(PROTOCOL_DIR, "results_all.sqlite")
+OUTPUT_CSV = os.path.join(PROTOCOL_DIR, "results_all.csv")
+# Serve the chunks over TCP, e.g. ("0.0.0.0", 5555), to workers started on any host with
+# python -m wbc.distributed worker <this host>:5555 (None runs on the local pool only)
+# Any address but 127.0.0.1 needs the same secret in WBC_AUTHKEY on the coordinator and every worker
+COORDINATOR = None
+
+
+def build_configs(keys):
+    """Settings of every job key (see wbc.simulation.run_chunk), from each strategy's config.yaml"""
+    configs = {}
+    for model in {key[1][0] for key in keys}:
+        base = netconfig.load_config(os.path.join(PROTOCOL_DIR, model, "config.yaml"))
+        for key in keys:
+            if key[1][0] == model:
+                p = key[1][1]
+                variant = netconfig.with_qdevice(base, two_qubit_gate_depolar_prob=float(p))
+                configs[key] = {
+                    "model": model,
+                    "engine": ENGINE,
+                    "num_states": NUM_STATES,
+                    "p": p,
+                    "seed": SEED,
+                    "network": netconfig.stack_network_config(variant) if ENGINE == "squidasm" else None,
+                    "application": application_constants(model, variant, NUM_STATES=NUM_STATES)
+                    if ENGINE == "squidasm" else {},
+                    "results_db": os.path.relpath(RESULTS_DB, PROTOCOL_DIR) if RESULTS_DB else None,
+                }
+    return configs
+
+
+def plan_jobs(keys, recorded, costs):
+    """Missing chunks of every key, most expensive first"""
+    jobs = []
+    for key in keys:
+        model = key[1][0]
+        for chunk in scheduler.missing_chunks(recorded.get(key, set()), TRIALS_PER_VALUE[model], TRIALS_PER_CHUNK):
+            jobs.append(key + chunk)
+    return sorted(jobs, key=lambda job: costs[job[:2]] * job[3], reverse=True)
+
+
+def run_all():
+    keys = list(enumerate((model, p) for model in STRATEGIES for p in DEPOLAR_VALUES))
+    configs = build_configs(keys)
+    pool_args = {"processes": cpu_count(), "initializer": set_configs, "initargs": (configs,)}
+    run_jobs = functools.partial(distributed.run_jobs, address=COORDINATOR) if COORDINATOR else scheduler.run_jobs
+    store = ResultStore(RESULTS_DB) if RESULTS_DB else None
+    # Remote workers record their trials on their own host, so a coordinator adds up the counts it receives
+    totals = {key: store.counts(key[1][0], ENGINE, NUM_STATES, key[1][1], SEED) for key in keys} if store and COORDINATOR else {}
+
+    def recorded_trials():
+        if store:
+            recorded = {key: store.recorded(key[1][0], ENGINE, NUM_STATES, key[1][1], SEED) for key in keys}
+            # The calibration trial may have run on a remote worker, outside the local store
+            for key in calibration:
+                recorded[key].add(0)
+            return recorded
+        return {key: set(range(totals.get(key, {}).get("trials", 0))) for key in keys}
+
+    # Measure the cost of the values without recorded trials with a single trial each
+    costs = {}
+    if store:
+        costs = {key: store.time_per_trial(key[1][0], ENGINE, NUM_STATES, key[1][1], SEED) for key in keys}
+    uncalibrated = [key for key in keys if costs.get(key) is None]
+    calibration = {}
+    if uncalibrated:
+        calibration = run_jobs(run_chunk, [key + (0, 1) for key in uncalibrated], **pool_args)
+        for key, counts in calibration.items():
+            costs[key] = counts["time"] / counts["trials"]
+            scheduler.merge_counts(totals.setdefault(key, {}), counts)
+
+    jobs = plan_jobs(keys, recorded_trials(), costs)
+    for key, counts in run_jobs(run_chunk, jobs, **pool_args).items():
+        scheduler.merge_counts(totals.setdefault(key, {}), counts)
+    if store:
+        if not COORDINATOR:
+            totals = {key: store.counts(key[1][0], ENGINE, NUM_STATES, key[1][1], SEED) for key in keys}
+        store.close()
+
+    with open(OUTPUT_CSV, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Model", "Depolar_Prob", "Trials", "Successes", "Failures", "Avg_Time", "Failure_Rate",
+                         "Std_Error"])
+        for key in keys:
+            model, p = key[1]
+            counts = totals[key]
+            writer.writerow([model, p, counts["trials"], counts["successes"], counts["failures"],
+                             counts["time"] / counts["trials"], *importance.estimate(counts)])
+    print(f"\nCombined results written to {OUTPUT_CSV}")
+
+
+if __name__ == "__main__":
+    run_all()
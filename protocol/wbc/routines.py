@@ -0,0 +1,92 @@
+"""Batched variants of squidasm.util.routines used by the protocol programs
+
+teleport_send / teleport_recv flush the connection once per qubit. The
+versions below teleport a whole batch of qubits with a single EPR request,
+a single flush and a single classical message carrying all correction bits.
+"""
+from netqasm.sdk.classical_communication.message import StructuredMessage
+from netqasm.sdk.qubit import Qubit
+
+# Qubits the sender holds per qubit group while it is being teleported:
+# the four circuit qubits plus one EPR half
+QUBITS_PER_GROUP = 5
+
+
+def batch_size(config, num_states, stack="Sender"):
+    """Number of qubit groups the sender can prepare per flush
+
+    Bounded by the qdevice's `num_qubits` in the network configuration (a
+    dict loaded from config.yaml) and by the sender's ProgramMeta budget of
+    `QUBITS_PER_GROUP * num_states` qubits.
+    """
+    num_qubits = QUBITS_PER_GROUP * num_states
+    for entry in config.get("stacks", []):
+        if entry.get("name") == stack:
+            num_qubits = min(num_qubits, entry.get("qdevice_cfg", {}).get("num_qubits", num_qubits))
+    return max(1, min(num_states, num_qubits // QUBITS_PER_GROUP))
+
+
+def teleport_send_batch(qubits, context, peer_name):
+    """Teleport every qubit in `qubits` to `peer_name`, in order"""
+    epr_socket = context.epr_sockets[peer_name]
+    csocket = context.csockets[peer_name]
+
+    eprs = epr_socket.create_keep(number=len(qubits))
+    corrections = []
+    for q, epr in zip(qubits, eprs):
+        q.cnot(epr)
+        q.H()
+        corrections.append((q.measure(), epr.measure()))
+    yield from context.connection.flush()
+
+    payload = [(int(m1), int(m2)) for m1, m2 in corrections]
+    csocket.send_structured(StructuredMessage("Corrections", payload))
+
+
+def teleport_recv_batch(context, peer_name, number):
+    """Receive `number` qubits teleported with teleport_send_batch, in order"""
+    epr_socket = context.epr_sockets[peer_name]
+    csocket = context.csockets[peer_name]
+
+    eprs = epr_socket.recv_keep(number=number)
+    yield from context.connection.flush()
+
+    msg = yield from csocket.recv_structured()
+    for epr, (m1, m2) in zip(eprs, msg.payload):
+        if m2 == 1:
+            epr.X()
+        if m1 == 1:
+            epr.Z()
+    yield from context.connection.flush()
+    return eprs
+
+
+def teleport_recv_measure_batch(context, peer_name, number):
+    """Receive `number` qubits teleported with teleport_send_batch and measure them on arrival
+
+    Returns the computational-basis outcomes, in order. The Z correction does
+    not change such an outcome and the X correction flips it, so every qubit
+    is measured as soon as it arrives and the X correction is applied to the
+    outcome classically. The qubits are freed before the corrections arrive,
+    so the receiver never holds more than `number` of them.
+    """
+    epr_socket = context.epr_sockets[peer_name]
+    csocket = context.csockets[peer_name]
+
+    eprs = epr_socket.recv_keep(number=number)
+    outcomes = [epr.measure() for epr in eprs]
+    yield from context.connection.flush()
+
+    msg = yield from csocket.recv_structured()
+    return [int(m) ^ m2 for m, (m1, m2) in zip(outcomes, msg.payload)]
+
+
+def measure_fresh_batch(connection, number):
+    """Outcomes of `number` freshly initialized qubits, prepared and measured in one subroutine
+
+    Each qubit is measured, and so freed, before the next one is allocated,
+    so a single qubit of memory is enough.
+    """
+    outcomes = [Qubit(connection).measure() for _ in range(number)]
+    yield from connection.flush()
+    return [int(m) for m in outcomes]
@@ -0,0 +1,56 @@
+"""Trial runner shared by the simulation scripts
+
+Every engine returns one (sender, receiver0, receiver1) tuple of result dicts
+per trial, which is what the success/failure rules in wbc.models consume.
+The importance engine adds each trial's weight to the sender's dict, see
+wbc.importance.
+"""
+import numpy as np
+
+from wbc import importance, models, seeding
+
+ENGINES = ("squidasm", "numpy", "distribution", "importance")
+
+
+def run_squidasm(cfg, programs, num_times):
+    """Run `num_times` trials of `programs` on a single network built from `cfg`
+
+    squidasm's run builds the network and stacks once and enqueues each
+    program `num_times` on its host, so the iterations execute back to back
+    instead of rebuilding everything per trial.
+    """
+    from squidasm.run.stack.run import run
+
+    result = run(config=cfg, programs=programs, num_times=num_times)
+    return list(zip(*result))
+
+
+def run_trials(engine, model, cfg, p, num_states, num_trials, programs=None, rng=None, seed=None, start=0):
+    """Run `num_trials` trials of `model` at depolarization `p` with the given engine
+
+    `cfg` and `programs` (a {"Sender": ..., "Receiver0": ..., "Receiver1": ...}
+    dict of program instances) are only used by the SquidASM engine. With a
+    base `seed`, the trials are numbered from `start` and every trial is run
+    from its own seed (see wbc.seeding), so results do not depend on how the
+    trials are chunked; `rng` is ignored then.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {ENGINES}")
+    if engine == "squidasm":
+        if seed is not None:
+            # The sender seeds the generators at the start of every trial, in a barrier with both receivers:
+            # SquidASM runs every host's iterations independently, so without it a receiver could still
+            # be drawing for the previous trial, or already for the next one, from the wrong seed
+            programs["Sender"].seeder = seeding.TrialSeeder(model, p, start, seed)
+            programs["Receiver0"].wait_for_seed = True
+            programs["Receiver1"].wait_for_seed = True
+        return run_squidasm(cfg, programs, num_trials)
+
+    run = {"numpy": models.run_numpy, "distribution": models.run_distribution,
+           "importance": importance.run_importance}[engine]
+    if seed is None:
+        return list(zip(*run(model, p, num_states, num_trials, rng)))
+    # Still one vectorized call for the whole chunk, every trial drawing from its own generator
+    streams = seeding.TrialStreams(np.random.default_rng(seeding.trial_seed(model, p, trial, seed))
+                                   for trial in range(start, start + num_trials))
+    return list(zip(*run(model, p, num_states, num_trials, streams)))
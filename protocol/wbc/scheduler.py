@@ -0,0 +1,150 @@
+"""Dynamic scheduling of sweep jobs over a process pool
+
+Instead of one task per depolarization value, every value's trials are split
+into chunks that are handed out to idle workers as they finish. Workers
+return `(key, counts)` pairs, where `counts` is a dict of numbers (trials,
+successes, failures, time, ...) that are summed per key.
+"""
+import queue
+from multiprocessing import Pool, cpu_count
+
+from wbc import stats
+
+
+def split_trials(num_trials, chunk_size, start=0):
+    """(first trial index, size) of the chunks `num_trials` trials are split into"""
+    chunk_size = max(1, chunk_size)
+    return [(first, min(chunk_size, start + num_trials - first))
+            for first in range(start, start + num_trials, chunk_size)]
+
+
+def missing_chunks(recorded, num_trials, chunk_size):
+    """Chunks covering the trial indices below `num_trials` that are not in `recorded`"""
+    chunks = []
+    first = None
+    for trial in range(num_trials + 1):
+        missing = trial < num_trials and trial not in recorded
+        if missing and first is None:
+            first = trial
+        elif not missing and first is not None:
+            chunks.extend(split_trials(trial - first, chunk_size, first))
+            first = None
+    return chunks
+
+
+def make_jobs(values, num_trials, chunk_size, recorded=None):
+    """(index, value, first trial, trials) jobs for every value, interleaved chunk by chunk
+
+    Interleaving makes sure no value waits behind all the chunks of another.
+    `recorded` optionally maps each (index, value) key to the trial indices
+    that already have a result; those trials are skipped.
+    """
+    per_value = [
+        missing_chunks((recorded or {}).get((idx, value), ()), num_trials, chunk_size)
+        for idx, value in enumerate(values)
+    ]
+    jobs = []
+    for position in range(max((len(chunks) for chunks in per_value), default=0)):
+        for (idx, value), chunks in zip(enumerate(values), per_value):
+            if position < len(chunks):
+                jobs.append((idx, value) + chunks[position])
+    return jobs
+
+
+def merge_counts(total, counts):
+    """Add the numeric entries of `counts` into `total`"""
+    for name, value in counts.items():
+        total[name] = total.get(name, 0) + value
+    return total
+
+
+def run_jobs(worker, jobs, processes=None, on_result=None, initializer=None, initargs=()):
+    """Run `worker` over `jobs` with dynamic load balancing
+
+    `on_result(key, counts)` is called in the parent for every finished chunk.
+    `initializer(*initargs)` runs once in every worker process, e.g. to hand
+    over network configurations. Returns a dict mapping each key to its
+    merged counts.
+    """
+    totals = {}
+    processes = processes or min(cpu_count(), len(jobs)) or 1
+    with Pool(processes=processes, initializer=initializer, initargs=initargs) as pool:
+        for key, counts in pool.imap_unordered(worker, jobs, chunksize=1):
+            merge_counts(totals.setdefault(key, {}), counts)
+            if on_result is not None:
+                on_result(key, counts)
+    return totals
+
+
+def run_adaptive(worker, values, chunk_size, target_width, max_trials, processes=None,
+                 method="wilson", confidence=0.95, on_result=None, initial=None, start=None,
+                 initializer=None, initargs=()):
+    """Run chunks of trials per value until its failure-rate interval is narrow enough
+
+    A value stops receiving chunks once the `method` interval ("wilson" or
+    "clopper-pearson") of its failure rate is narrower than `target_width`,
+    or once `max_trials` trials have been run or scheduled for it. The
+    interval is projected over the trials still running as well, at the
+    failure rate seen so far, and a value without any result yet gets only
+    one chunk, so idle workers do not all pile chunks onto a value that is
+    nearly done. Idle workers always get a chunk of the value with the
+    widest interval, so the compute goes to the points that need it. Counts must contain "trials"
+    and "failures". `initial` and `start` optionally give, per (index, value)
+    key, counts that are already available and the first trial index to use.
+    `initializer` and `initargs` are passed on to the pool as in `run_jobs`.
+    Returns the merged counts per key.
+    """
+    keys = list(enumerate(values))
+    totals = {key: dict((initial or {}).get(key, {})) for key in keys}
+    next_trial = {key: (start or {}).get(key, 0) for key in keys}
+    in_flight = {key: 0 for key in keys}
+    processes = processes or min(cpu_count(), len(keys)) or 1
+    done = queue.Queue()
+    running = 0
+
+    def width(key):
+        # Interval once the running chunks are in, if they fail at the rate seen so far
+        counts = totals[key]
+        if not counts.get("trials"):
+            return 1.0
+        trials = counts["trials"] + in_flight[key]
+        failures = round(counts["failures"] * trials / counts["trials"])
+        return stats.interval_width(failures, trials, method, confidence)
+
+    def needs_more(key):
+        if totals[key].get("trials", 0) + in_flight[key] >= max_trials:
+            return False
+        if not totals[key].get("trials") and in_flight[key]:
+            return False
+        return width(key) > target_width
+
+    with Pool(processes=processes, initializer=initializer, initargs=initargs) as pool:
+        def top_up():
+            nonlocal running
+            while running < processes:
+                candidates = [key for key in keys if needs_more(key)]
+                if not candidates:
+                    return
+                # Prefer values with nothing running, then the widest interval
+                key = max(candidates, key=lambda key: (in_flight[key] == 0, width(key)))
+                size = min(chunk_size, max_trials - totals[key].get("trials", 0) - in_flight[key])
+                in_flight[key] += size
+                running += 1
+                job = (key[0], key[1], next_trial[key], size)
+                next_trial[key] += size
+                pool.apply_async(worker, (job,),
+                                 callback=done.put, error_callback=done.put)
+
+        top_up()
+        while running:
+            item = done.get()
+            running -= 1
+            if isinstance(item, BaseException):
+                raise item
+            key, counts = item
+            in_flight[key] -= counts["trials"]
+            merge_counts(totals[key], counts)
+            if on_result is not None:
+                on_result(key, counts)
+            top_up()
+    return totals
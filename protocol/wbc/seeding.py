@@ -0,0 +1,91 @@
+"""Counter-based seeds for individual trials
+
+The seed of a trial is a hash of (base seed, strategy, depolarization value,
+trial index), so it does not depend on which worker runs the trial or on
+how the trials were split into chunks. Any subset of trials can be run again
+anywhere and gives the same results.
+"""
+import hashlib
+import random
+
+import numpy as np
+
+
+def trial_seed(model, p, trial, base=0):
+    """32-bit seed of one trial, as accepted by NetSquid, `random` and NumPy"""
+    digest = hashlib.sha256(f"{base}:{model}:{float(p)!r}:{int(trial)}".encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def seed_trial(model, p, trial, base=0):
+    """Seed Python's and NetSquid's random number generators for one trial"""
+    seed = trial_seed(model, p, trial, base)
+    random.seed(seed)
+    try:
+        import netsquid as ns
+    except ImportError:
+        return seed
+    ns.set_random_state(seed=seed)
+    return seed
+
+
+class TrialSeeder:
+    """Seeds the generators for trials start, start + 1, ... on every call to `seed_next`"""
+
+    def __init__(self, model, p, start=0, base=0):
+        self.model = model
+        self.p = p
+        self.trial = start
+        self.base = base
+
+    def seed_next(self):
+        seed = seed_trial(self.model, self.p, self.trial, self.base)
+        self.trial += 1
+        return seed
+
+
+class TrialStreams:
+    """Random draws of a batch of trials, every trial's share from its own generator
+
+    Stands in for a NumPy Generator in the vectorized engines: a draw of
+    `size` values covers the same number of consecutive values for every
+    trial, which each trial takes from its own generator. A trial thus gets
+    the same values in a batch as when run alone, as long as every draw
+    covers all trials of the batch (see wbc.engine).
+    """
+
+    def __init__(self, generators):
+        self.generators = list(generators)
+
+    def __len__(self):
+        return len(self.generators)
+
+    def trial(self, k):
+        """Generator of the k-th trial of the batch, for the per-trial steps of a strategy"""
+        return self.generators[k]
+
+    def split(self, first, stop):
+        """Streams of trials first, ..., stop - 1 of the batch"""
+        return TrialStreams(self.generators[first:stop])
+
+    def _share(self, size):
+        if size % len(self.generators):
+            raise ValueError(f"A draw of {size} values cannot be split over {len(self.generators)} trials")
+        return size // len(self.generators)
+
+    def random(self, size):
+        share = self._share(size)
+        return np.concatenate([g.random(share) for g in self.generators])
+
+    def integers(self, low, high, size):
+        share = self._share(size)
+        return np.concatenate([g.integers(low, high, size=share) for g in self.generators])
+
+    def multinomial(self, n, pvals, size):
+        share = self._share(size)
+        return np.concatenate([g.multinomial(n, pvals, size=share) for g in self.generators])
+
+
+def trial_generator(rng, k):
+    """Generator of the k-th trial of a batch: its own with TrialStreams, else the shared `rng`"""
+    return rng.trial(k) if isinstance(rng, TrialStreams) else rng
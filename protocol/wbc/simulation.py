@@ -0,0 +1,288 @@
+"""Sweep driver shared by the simulation_<strategy>.py scripts
+
+A script only sets the constants of its strategy (MODEL, DEPOLAR_VALUES,
+NUM_STATES, ENGINE, ...) and hands them to `main`, which runs either the
+sweep over DEPOLAR_VALUES or the threshold search.
+
+Chunks of trials run in `run_chunk`, which wbc.orchestrator and wbc.sweep use
+as well. It looks up the settings of its job key (strategy, engine, network,
+depolarization value, seed, application constants and result store) in
+`CONFIGS`, which the pool initializer fills in every worker process, so a
+worker on another host needs nothing but its own checkout.
+"""
+import csv
+import functools
+import importlib.util
+import os
+import time
+from multiprocessing import cpu_count
+
+from wbc import distributed, importance, models, netconfig, runner, scheduler, threshold, timing
+from wbc.store import ResultStore
+
+PROTOCOL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_application(model, **constants):
+    """Import <model>/application.py under its own module name, with `constants` overridden"""
+    path = os.path.join(PROTOCOL_DIR, model, "application.py")
+    spec = importlib.util.spec_from_file_location(f"{model}_application", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for name, value in constants.items():
+        setattr(module, name, value)
+    return module
+
+
+# Constants of application.py that a job can override
+APPLICATION_CONSTANTS = ("NUM_STATES", "BATCH_SIZE", "MEASURE_ON_ARRIVAL", "CLASSICAL_CONSISTENCY",
+                         "OPTIMIZE_CIRCUIT", "SUBROUTINE_CACHE", "TIMING")
+# Flags that skip or merge single-qubit gates, and the stacks whose gates they change: they only
+# give the results of the thesis circuit when those stacks have no single-qubit gate or memory noise
+SHORTCUTS = {"OPTIMIZE_CIRCUIT": ("Sender",), "MEASURE_ON_ARRIVAL": ("Receiver0", "Receiver1")}
+
+
+def exact_shortcuts(config, constants):
+    """`constants` with the SHORTCUTS switched off that would change the results on network `config`"""
+    return {name: bool(value) and netconfig.noiseless_single_qubit(config, SHORTCUTS[name])
+            if name in SHORTCUTS else value for name, value in constants.items()}
+
+
+def application_constants(model, config, **constants):
+    """All APPLICATION_CONSTANTS of a strategy on network `config`, with `constants` overridden
+
+    The others keep the values of the strategy's application.py, except for
+    BATCH_SIZE, which is derived from the sender's memory in `config`, and
+    the SHORTCUTS, which are switched off where `config` has single-qubit noise.
+    """
+    # Imports NetQASM, which only the SquidASM engine needs
+    from wbc import routines
+
+    defaults = programs_module(model, {})
+    values = {name: constants.get(name, getattr(defaults, name)) for name in APPLICATION_CONSTANTS}
+    if "BATCH_SIZE" not in constants:
+        values["BATCH_SIZE"] = routines.batch_size(config, values["NUM_STATES"])
+    return exact_shortcuts(config, values)
+
+
+# Settings of every job key, handed to the workers by the pool initializer,
+# and the application modules loaded for them in this process
+CONFIGS = {}
+APPLICATIONS = {}
+
+
+def set_configs(configs):
+    CONFIGS.update(configs)
+
+
+def programs_module(model, constants):
+    """A strategy's application module with `constants` overridden, loaded once per set of constants"""
+    loaded = (model, tuple(sorted(constants.items())))
+    if loaded not in APPLICATIONS:
+        APPLICATIONS[loaded] = load_application(model, **constants)
+    return APPLICATIONS[loaded]
+
+
+def programs(model, constants):
+    """Fresh program instances of a strategy's application, see `programs_module`"""
+    application = programs_module(model, constants)
+    return {
+        "Sender": application.SenderProgram(),
+        "Receiver0": application.Receiver0Program(),
+        "Receiver1": application.Receiver1Program(),
+    }
+
+
+def run_chunk(job):
+    """Counts of one chunk of trials, recorded in the result store its settings name, if any"""
+    idx, value, start, num_trials = job
+    settings = CONFIGS[(idx, value)]
+    model, engine, num_states, p, seed = (settings[name] for name in ("model", "engine", "num_states", "p", "seed"))
+    instances = programs(model, settings["application"]) if engine == "squidasm" else None
+
+    start_time = time.time()
+    trials = runner.run_trials(engine, model, settings["network"], p, num_states, num_trials, instances,
+                               seed=seed, start=start)
+    total_time = time.time() - start_time
+
+    failed = models.FAILURE_RULES[model]
+    rows = [
+        (trial, failed(num_states, *result), total_time / num_trials, list(result))
+        for trial, result in enumerate(trials, start)
+    ]
+    if settings.get("results_db"):
+        store = ResultStore(os.path.join(PROTOCOL_DIR, settings["results_db"]))
+        store.record(model, engine, num_states, p, seed, rows)
+        store.close()
+
+    failures = sum(1 for row in rows if row[1])
+    counts = {"trials": num_trials, "successes": num_trials - failures, "failures": failures, "time": total_time}
+    # Importance engine: add up the weighted failures, see wbc.importance
+    for _, failure, _, result in rows:
+        scheduler.merge_counts(counts, importance.trial_counts(result[0], failure))
+    return (idx, value), counts
+
+
+def job_settings(constants, p, config):
+    """Settings of one depolarization value of a script's sweep on network `config`, see `run_chunk`"""
+    results_db = constants["RESULTS_DB"]
+    squidasm = constants["ENGINE"] == "squidasm"
+    return {
+        "model": constants["MODEL"],
+        "engine": constants["ENGINE"],
+        "num_states": constants["NUM_STATES"],
+        "p": p,
+        "seed": constants["SEED"],
+        "network": netconfig.stack_network_config(config) if squidasm else None,
+        "application": application_constants(
+            constants["MODEL"], config, NUM_STATES=constants["NUM_STATES"], TIMING=constants["TIMING"],
+            MEASURE_ON_ARRIVAL=constants["MEASURE_ON_ARRIVAL"]) if squidasm else {},
+        # Relative to protocol/, so workers on other hosts use the store of their own checkout
+        "results_db": os.path.relpath(os.path.abspath(results_db), PROTOCOL_DIR) if results_db else None,
+    }
+
+
+def sweep_configs(constants, base, values):
+    """Settings of every (index, value) key of a script's sweep"""
+    return {
+        (idx, p): job_settings(constants, p, netconfig.with_qdevice(base, two_qubit_gate_depolar_prob=float(p)))
+        for idx, p in enumerate(values)
+    }
+
+
+def write_results(p, counts):
+    """Write the merged counts of one depolarization value to its result file"""
+    output_csv = f"results_p={p:.8f}.csv"
+    trials = counts["trials"]
+    avg_time = counts["time"] / trials
+    fail_rate = counts["failures"] / trials
+    # Importance engine: the failure rate is the weighted estimate, its sums are kept for wbc.aggregate
+    weighted = []
+    if "weighted_failures" in counts:
+        fail_rate, std_error = importance.estimate(counts)
+        weighted = [counts["weighted_failures"], counts["weighted_failures_sq"], std_error]
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Depolar_Prob", "Trials", "Successes", "Failures", "Avg_Time", "Failure_Rate"]
+                        + (["Weighted_Failures", "Weighted_Failures_Sq", "Std_Error"] if weighted else []))
+        writer.writerow([p, trials, counts["successes"], counts["failures"], avg_time, fail_rate] + weighted)
+    return output_csv
+
+
+def write_timing(constants, store):
+    """Mean wall time, simulated time and flushes per phase of every program, for each value"""
+    output_csv = "timing.csv"
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Depolar_Prob", "Party", "Phase", "Wall_Time", "Sim_Time_ns", "Flushes"])
+        for p in constants["DEPOLAR_VALUES"]:
+            summary = timing.summarize(store.results(constants["MODEL"], constants["ENGINE"],
+                                                     constants["NUM_STATES"], p, constants["SEED"]))
+            for party, phases in summary.items():
+                for phase, counts in phases.items():
+                    writer.writerow([p, party, phase, counts["wall"], counts["sim"], counts["flushes"]])
+    return output_csv
+
+
+def run_sweep(constants):
+    """Full sweep over DEPOLAR_VALUES, one result file per value"""
+    model, engine, num_states, seed = (constants[name] for name in ("MODEL", "ENGINE", "NUM_STATES", "SEED"))
+    values = constants["DEPOLAR_VALUES"]
+    coordinator = constants["COORDINATOR"]
+    # Same network as BASE_CONFIG, with the 2-qubit depolarization probability of each value
+    configs = sweep_configs(constants, netconfig.load_config(constants["BASE_CONFIG"]), values)
+
+    # Trials recorded by an earlier, interrupted run of this sweep are not run again
+    keys = list(enumerate(values))
+    store = ResultStore(constants["RESULTS_DB"]) if constants["RESULTS_DB"] else None
+    recorded = {key: store.recorded(model, engine, num_states, key[1], seed) for key in keys} if store else None
+
+    # Rewrite a value's result file after each of its chunks, so the plots can follow the sweep
+    # With a coordinator, trials of remote workers are not in the local store: counts are merged here
+    running = {key: store.counts(model, engine, num_states, key[1], seed) for key in keys} if store and coordinator else {}
+
+    def update_results(key, counts):
+        if store and not coordinator:
+            write_results(key[1], store.counts(model, engine, num_states, key[1], seed))
+        else:
+            write_results(key[1], scheduler.merge_counts(running.setdefault(key, {}), counts))
+
+    # Split every depolarization value into chunks of trials, balanced dynamically over all cores
+    pool_args = {"processes": cpu_count(), "on_result": update_results,
+                 "initializer": set_configs, "initargs": (configs,)}
+    if constants["TARGET_CI_WIDTH"] is None:
+        jobs = scheduler.make_jobs(values, constants["TRIALS_PER_VALUE"], constants["TRIALS_PER_CHUNK"], recorded)
+        run_jobs = functools.partial(distributed.run_jobs, address=coordinator) if coordinator else scheduler.run_jobs
+        totals = run_jobs(run_chunk, jobs, **pool_args)
+    elif coordinator:
+        raise ValueError("COORDINATOR only serves fixed-size sweeps, set TARGET_CI_WIDTH = None")
+    else:
+        initial = {key: store.counts(model, engine, num_states, key[1], seed) for key in keys} if store else None
+        start = {key: store.next_trial(model, engine, num_states, key[1], seed) for key in keys} if store else None
+        totals = scheduler.run_adaptive(run_chunk, values, constants["TRIALS_PER_CHUNK"],
+                                        constants["TARGET_CI_WIDTH"], constants["MAX_TRIALS_PER_VALUE"],
+                                        method=constants["CI_METHOD"], initial=initial, start=start, **pool_args)
+    if coordinator:
+        totals = running
+    elif store:
+        totals = {key: store.counts(model, engine, num_states, key[1], seed) for key in keys}
+    if store:
+        if constants["TIMING"]:
+            print(f"\nPer-phase timings written to {write_timing(constants, store)}")
+        store.close()
+    result_files = [(p, write_results(p, totals[(idx, p)])) for idx, p in enumerate(values)]
+
+    # Debug print
+    print("\nGenerated result files:")
+    for p, file in result_files:
+        print(f"  - p={p:.8f}: {file}")
+
+
+def estimate_failures(constants, base, next_trial, p, num_trials):
+    """(failures, trials) of `num_trials` new trials at any depolarization value, spread over the pool in chunks
+
+    `next_trial` maps every value to the first trial index not run yet in
+    this search. Seeded trials with the same index give the same result, so
+    every call must run trials of its own, even without a result store or
+    when remote workers record them in theirs.
+    """
+    idx = "threshold"
+    configs = {(idx, p): sweep_configs(constants, base, [p])[(0, p)]}
+    start = next_trial.get(p, 0)
+    if constants["RESULTS_DB"]:
+        store = ResultStore(constants["RESULTS_DB"])
+        start = max(start, store.next_trial(constants["MODEL"], constants["ENGINE"], constants["NUM_STATES"], p,
+                                            constants["SEED"]))
+        store.close()
+    next_trial[p] = start + num_trials
+    jobs = [(idx, p) + chunk for chunk in scheduler.split_trials(num_trials, constants["TRIALS_PER_CHUNK"], start)]
+    # With a coordinator, every probe is served to the workers like a sweep of its own
+    coordinator = constants["COORDINATOR"]
+    run_jobs = functools.partial(distributed.run_jobs, address=coordinator) if coordinator else scheduler.run_jobs
+    totals = run_jobs(run_chunk, jobs, processes=cpu_count(), initializer=set_configs, initargs=(configs,))
+    counts = totals[(idx, p)]
+    return counts["failures"], counts["trials"]
+
+
+def run_threshold_search(constants):
+    """Bisect for the depolarization value where failures leave the error-free baseline"""
+    estimate = functools.partial(estimate_failures, constants, netconfig.load_config(constants["BASE_CONFIG"]), {})
+    crossing, probes = threshold.find_threshold(estimate, *constants["THRESHOLD_RANGE"],
+                                                constants["THRESHOLD_MARGIN"],
+                                                max_trials=constants["MAX_TRIALS_PER_VALUE"],
+                                                method=constants["CI_METHOD"])
+    with open("threshold.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Depolar_Prob", "Trials", "Failures", "Failure_Rate", "Above_Target"])
+        for probe in probes:
+            writer.writerow([probe["p"], probe["trials"], probe["failures"],
+                             probe["failures"] / probe["trials"], probe["above"]])
+    print(f"\nThreshold: p = {crossing:.3e} ({len(probes)} probes, written to threshold.csv)")
+
+
+def main(constants):
+    """Run the sweep or the threshold search configured by a script's constants, e.g. main(globals())"""
+    if constants["THRESHOLD_SEARCH"]:
+        run_threshold_search(constants)
+    else:
+        run_sweep(constants)
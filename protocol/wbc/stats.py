@@ -0,0 +1,62 @@
+"""Confidence intervals for Monte Carlo failure rates"""
+import math
+from statistics import NormalDist
+
+from wbc.exact import binom_pmf
+
+
+def z_value(confidence):
+    """Two-sided standard normal quantile for the given confidence level"""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(failures, trials, confidence=0.95):
+    """Wilson score interval of a binomial proportion"""
+    if trials == 0:
+        return 0.0, 1.0
+    z = z_value(confidence)
+    rate = failures / trials
+    denom = 1 + z ** 2 / trials
+    centre = (rate + z ** 2 / (2 * trials)) / denom
+    half = z * math.sqrt(rate * (1 - rate) / trials + z ** 2 / (4 * trials ** 2)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def _binom_cdf(k, n, p):
+    if k < 0:
+        return 0.0
+    return float(binom_pmf(n, p)[:k + 1].sum())
+
+
+def _bisect(f, target, increasing, iterations=60):
+    low, high = 0.0, 1.0
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        if (f(mid) < target) == increasing:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+def clopper_pearson_interval(failures, trials, confidence=0.95):
+    """Exact (Clopper-Pearson) interval of a binomial proportion"""
+    if trials == 0:
+        return 0.0, 1.0
+    alpha = 1 - confidence
+    k, n = failures, trials
+    # Lower bound: P(X >= k) = alpha / 2, upper bound: P(X <= k) = alpha / 2
+    low = 0.0 if k == 0 else _bisect(lambda p: 1 - _binom_cdf(k - 1, n, p), alpha / 2, True)
+    high = 1.0 if k == n else _bisect(lambda p: _binom_cdf(k, n, p), alpha / 2, False)
+    return low, high
+
+
+INTERVALS = {
+    "wilson": wilson_interval,
+    "clopper-pearson": clopper_pearson_interval,
+}
+
+
+def interval_width(failures, trials, method="wilson", confidence=0.95):
+    low, high = INTERVALS[method](failures, trials, confidence)
+    return high - low
@@ -0,0 +1,139 @@
+"""Append-only SQLite store of per-trial results
+
+Workers record every trial as soon as its chunk finishes, so an interrupted
+sweep keeps everything computed so far. A trial is identified by the
+strategy, engine, number of states, depolarization value, base seed (NULL
+for unseeded runs, see wbc.seeding) and trial index; recording the same
+trial twice keeps the first result. Runs with different seeds are kept
+apart, so trial i of one seed is never mistaken for trial i of another.
+
+Trials of the importance engine carry a weight in the sender's result; their
+weighted failures are summed as well (see wbc.importance.trial_counts).
+"""
+import json
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    model TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    num_states INTEGER NOT NULL,
+    depolar_prob REAL NOT NULL,
+    seed INTEGER,
+    trial INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    time REAL NOT NULL,
+    result TEXT,
+    PRIMARY KEY (model, engine, num_states, depolar_prob, seed, trial)
+)
+"""
+
+# SQLite keys treat NULLs as distinct, so unseeded trials get a key of their own
+UNSEEDED_KEY = """
+CREATE UNIQUE INDEX IF NOT EXISTS unseeded_trials ON trials (model, engine, num_states, depolar_prob, trial)
+WHERE seed IS NULL
+"""
+
+# Trials of one configuration
+WHERE_CONFIG = "model = ? AND engine = ? AND num_states = ? AND depolar_prob = ? AND seed IS ?"
+
+# Weighted failure of a trial of the importance engine, NULL for the other engines
+WEIGHTED_FAILURE = "json_extract(result, '$[0].baseline') + failed * json_extract(result, '$[0].weight')"
+
+
+def _to_json(value):
+    # NumPy scalars in result dicts
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class ResultStore:
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self._add_seed_column()
+        self.connection.execute(SCHEMA)
+        self.connection.execute(UNSEEDED_KEY)
+        self.connection.commit()
+
+    def _add_seed_column(self):
+        # Stores written before the seed was recorded: their trials are kept as unseeded
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(trials)")]
+        if not columns or "seed" in columns:
+            return
+        with self.connection:
+            self.connection.execute("ALTER TABLE trials RENAME TO trials_without_seed")
+            self.connection.execute(SCHEMA)
+            self.connection.execute(
+                "INSERT INTO trials SELECT model, engine, num_states, depolar_prob, NULL, trial, failed, time, result "
+                "FROM trials_without_seed"
+            )
+            self.connection.execute("DROP TABLE trials_without_seed")
+
+    def close(self):
+        self.connection.close()
+
+    def record(self, model, engine, num_states, p, seed, rows):
+        """Append trials given as (trial, failed, time, result) tuples"""
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (model, engine, num_states, float(p), seed, int(trial), int(bool(failed)), float(elapsed),
+                 json.dumps(result, default=_to_json))
+                for trial, failed, elapsed, result in rows
+            ],
+        )
+        self.connection.commit()
+
+    def recorded(self, model, engine, num_states, p, seed):
+        """Indices of the trials already recorded for this configuration"""
+        rows = self.connection.execute(
+            f"SELECT trial FROM trials WHERE {WHERE_CONFIG}",
+            (model, engine, num_states, float(p), seed),
+        )
+        return {trial for (trial,) in rows}
+
+    def next_trial(self, model, engine, num_states, p, seed):
+        """First trial index after every recorded one"""
+        (last,) = self.connection.execute(
+            f"SELECT MAX(trial) FROM trials WHERE {WHERE_CONFIG}",
+            (model, engine, num_states, float(p), seed),
+        ).fetchone()
+        return 0 if last is None else last + 1
+
+    def counts(self, model, engine, num_states, p, seed):
+        """Counts in the format used by wbc.scheduler"""
+        trials, failures, elapsed, weighted, weighted_sq = self.connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(failed), 0), COALESCE(SUM(time), 0), "
+            f"SUM({WEIGHTED_FAILURE}), SUM(({WEIGHTED_FAILURE}) * ({WEIGHTED_FAILURE})) FROM trials "
+            f"WHERE {WHERE_CONFIG}",
+            (model, engine, num_states, float(p), seed),
+        ).fetchone()
+        counts = {"trials": trials, "successes": trials - failures, "failures": failures, "time": elapsed}
+        if weighted is not None:
+            counts.update({"weighted_failures": weighted, "weighted_failures_sq": weighted_sq})
+        return counts
+
+    def time_per_trial(self, model, engine, num_states, p, seed):
+        """Average wall time of the recorded trials, or None if there are none"""
+        (elapsed,) = self.connection.execute(
+            f"SELECT AVG(time) FROM trials WHERE {WHERE_CONFIG}",
+            (model, engine, num_states, float(p), seed),
+        ).fetchone()
+        return elapsed
+
+    def trials_after(self, model, engine, num_states, seed, rowid):
+        """(rowid, p, failed, time, weighted failure or None) of the trials inserted after `rowid`, in insertion order"""
+        return self.connection.execute(
+            f"SELECT rowid, depolar_prob, failed, time, {WEIGHTED_FAILURE} FROM trials "
+            "WHERE rowid > ? AND model = ? AND engine = ? AND num_states = ? AND seed IS ? ORDER BY rowid",
+            (rowid, model, engine, num_states, seed),
+        ).fetchall()
+
+    def results(self, model, engine, num_states, p, seed):
+        """Result tuples of the recorded trials, by trial index"""
+        rows = self.connection.execute(
+            f"SELECT result FROM trials WHERE {WHERE_CONFIG} ORDER BY trial",
+            (model, engine, num_states, float(p), seed),
+        )
+        return [json.loads(result) for (result,) in rows if result is not None]
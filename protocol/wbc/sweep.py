@@ -0,0 +1,190 @@
+"""Sweeps over any network parameters, on a grid or a Latin hypercube
+
+Usage, from the protocol/ directory:
+
+    python -m wbc.sweep design.yaml
+
+A design file names the strategy and the parameters to vary, as the paths
+understood by wbc.netconfig.with_parameters:
+
+    model: no_faulty
+    engine: squidasm
+    num_states: 280
+    trials: 100
+    design: grid
+    parameters:
+      qdevice.two_qubit_gate_depolar_prob: [0.0001, 0.001, 0.01]
+      qdevice.single_qubit_gate_depolar_prob: [0, 0.001]
+      link.typ: [perfect]
+
+With `design: latin_hypercube`, every parameter is a range instead and
+`samples` points are drawn, one per stratum of every parameter:
+
+    design: latin_hypercube
+    samples: 20
+    seed: 1
+    parameters:
+      qdevice.two_qubit_gate_depolar_prob: {low: 0.00001, high: 0.1, log: true}
+      qdevice.T1: {low: 0, high: 1.0e9}
+
+Design points that lead to the same network configuration are run once. The
+counts of every configuration are cached (wbc.cache, namespace "sweep") as
+soon as its last chunk finishes, so rerunning or extending a design only runs
+the new configurations. The trials of all configurations are split into
+chunks that share one pool, and the counts of every design point are written
+to `output` (sweep.csv by default). Optional keys: `config` (base network
+file, the strategy's config.yaml by default), `chunk` (trials per chunk),
+`trial_seed` (base of the per-trial seeds of wbc.seeding, 0 by default, null
+leaves the generators unseeded), `application` (constants of the strategy's
+application.py, e.g. {MEASURE_ON_ARRIVAL: true}, SquidASM only). The cache key
+of a configuration holds the application constants that change its counts
+and the sender's gate list, so changing either runs it again.
+"""
+import argparse
+import csv
+import itertools
+import os
+from multiprocessing import cpu_count
+
+import numpy as np
+import yaml
+
+from wbc import cache, importance, netconfig, scheduler
+from wbc.circuit import CIRCUIT, OPTIMIZED
+from wbc.simulation import PROTOCOL_DIR, application_constants, run_chunk, set_configs
+
+# Application constants that change the counts of a configuration, part of its cache key
+RESULT_CONSTANTS = ("BATCH_SIZE", "MEASURE_ON_ARRIVAL", "CLASSICAL_CONSISTENCY", "OPTIMIZE_CIRCUIT")
+# The NumPy engines only model the sender's two-qubit gate depolarization
+DEPOLAR_PARAMETERS = ("qdevice.two_qubit_gate_depolar_prob", "Sender.qdevice.two_qubit_gate_depolar_prob")
+
+
+def grid(parameters):
+    """Every combination of the listed parameter values"""
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[name] for name in names))]
+
+
+def latin_hypercube(parameters, samples, seed=None):
+    """`samples` points with exactly one point in each of `samples` equal strata of every range"""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, spec in parameters.items():
+        position = (rng.permutation(samples) + rng.random(samples)) / samples
+        low, high = spec["low"], spec["high"]
+        if spec.get("log"):
+            values = 10 ** (np.log10(low) + position * (np.log10(high) - np.log10(low)))
+        else:
+            values = low + position * (high - low)
+        columns[name] = [float(value) for value in values]
+    return [{name: columns[name][i] for name in parameters} for i in range(samples)]
+
+
+def design_points(design):
+    kind = design.get("design", "grid")
+    if kind == "grid":
+        return grid(design["parameters"])
+    if kind == "latin_hypercube":
+        return latin_hypercube(design["parameters"], design["samples"], design.get("seed"))
+    raise ValueError(f"Unknown design {kind!r}, expected 'grid' or 'latin_hypercube'")
+
+
+def sender_depolarization(config):
+    for stack in config.get("stacks", []):
+        if stack.get("name") == "Sender":
+            return float(stack.get("qdevice_cfg", {}).get("two_qubit_gate_depolar_prob", 0))
+    return 0.0
+
+
+def run_design(design, processes=None):
+    """Counts of every design point, as (point, counts) pairs"""
+    model = design["model"]
+    engine = design.get("engine", "squidasm")
+    num_states = design.get("num_states", 280)
+    num_trials = design["trials"]
+    points = design_points(design)
+    if engine != "squidasm" and any(name not in DEPOLAR_PARAMETERS for name in design["parameters"]):
+        raise ValueError(f"The {engine} engine only varies the two-qubit depolarization, use squidasm")
+    if engine != "squidasm" and design.get("application"):
+        raise ValueError(f"The {engine} engine has no application constants, use squidasm")
+
+    # Identical configurations share one cache key and are run once
+    base = netconfig.load_config(design.get("config") or os.path.join(PROTOCOL_DIR, model, "config.yaml"))
+    variants = {}
+    point_keys = []
+    for point in points:
+        variant = netconfig.with_parameters(base, point)
+        # Design points that change a qdevice's num_qubits have their own batch size, and points with
+        # single-qubit noise run without the shortcuts of simulation.SHORTCUTS
+        application = application_constants(model, variant, NUM_STATES=num_states,
+                                            **design.get("application", {})) if engine == "squidasm" else {}
+        key = {"model": model, "engine": engine, "num_states": num_states, "trials": num_trials,
+               "trial_seed": design.get("trial_seed", 0), "config": variant,
+               "application": {name: application.get(name) for name in RESULT_CONSTANTS},
+               "gates": OPTIMIZED if application.get("OPTIMIZE_CIRCUIT") else CIRCUIT}
+        variants.setdefault(cache.cache_key(key), (key, variant, application))
+        point_keys.append(cache.cache_key(key))
+
+    totals = {}
+    settings = {}
+    for name, (key, variant, application) in variants.items():
+        counts = cache.load("sweep", key)
+        if counts is not None:
+            totals[name] = counts
+            continue
+        settings[name] = {
+            "model": model,
+            "engine": engine,
+            "num_states": num_states,
+            "p": sender_depolarization(variant),
+            "seed": design.get("trial_seed", 0),
+            "network": netconfig.stack_network_config(variant) if engine == "squidasm" else None,
+            "application": application,
+        }
+    print(f"{len(points)} design points, {len(variants)} distinct configurations, "
+          f"{len(variants) - len(settings)} cached")
+
+    # Cache every configuration as soon as all its trials are done
+    def on_result(job_key, counts):
+        name = job_key[1]
+        total = scheduler.merge_counts(totals.setdefault(name, {}), counts)
+        if total["trials"] == num_trials:
+            cache.store("sweep", variants[name][0], total)
+
+    names = list(settings)
+    jobs = scheduler.make_jobs(names, num_trials, design.get("chunk", 25))
+    if jobs:
+        configs = {(idx, name): settings[name] for idx, name in enumerate(names)}
+        scheduler.run_jobs(run_chunk, jobs, processes=processes or cpu_count(), on_result=on_result,
+                           initializer=set_configs, initargs=(configs,))
+    return [(point, totals[key]) for point, key in zip(points, point_keys)]
+
+
+def write_results(path, parameters, results):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(parameters) + ["Trials", "Successes", "Failures", "Avg_Time", "Failure_Rate",
+                                            "Std_Error"])
+        for point, counts in results:
+            trials = counts["trials"]
+            writer.writerow([point[name] for name in parameters] + [
+                trials, counts["successes"], counts["failures"], counts["time"] / trials,
+                *importance.estimate(counts)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("design", help="YAML design file")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.design, "r") as f:
+        design = yaml.safe_load(f)
+    results = run_design(design, args.processes)
+    output = design.get("output", "sweep.csv")
+    write_results(output, design["parameters"], results)
+    print(f"Results of {len(results)} design points written to {output}")
+
+
+if __name__ == "__main__":
+    main()
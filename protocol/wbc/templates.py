@@ -0,0 +1,73 @@
+"""Compiled-subroutine cache for circuits that are submitted over and over
+
+Building a NetQASM subroutine gate by gate and compiling it costs Python time
+on every flush, although the sender's state-preparation subroutine is the
+same for every batch: fresh qubits, a fixed gate sequence, no measurements.
+The only operands that change are the virtual qubit addresses, and those are
+chosen as the lowest free ones, so they repeat as well.
+
+A `SubroutineTemplate` builds and compiles a circuit, given as a gate list of
+wbc.circuit, the first time it is submitted for a given gate list, number of
+copies and set of occupied qubit addresses. Later submissions with the same
+key only allocate the Qubit objects, without adding any commands, and
+resubmit the compiled subroutine under the connection's current app id.
+
+The first reuse of a compiled subroutine still builds the circuit as well, and
+submits that build. If it compiles to other instructions than the cached
+subroutine, the key is never cached again and every batch is built as
+without the cache.
+"""
+from netqasm.sdk.qubit import Qubit
+
+from wbc.circuit import apply as apply_circuit
+
+
+class SubroutineTemplate:
+    def __init__(self, num_qubits):
+        """Every copy of a circuit acts on `num_qubits` fresh qubits"""
+        self.num_qubits = num_qubits
+        self.compiled = {}
+        # Keys whose compiled subroutine matched a fresh build, and keys whose did not
+        self.verified = set()
+        self.uncacheable = set()
+        self.hits = 0
+        self.misses = 0
+
+    def submit(self, connection, circuit, copies, cache=True):
+        """Prepare `copies` copies of the gate list `circuit` in one subroutine and return their qubit tuples
+
+        Commands already pending on the connection are flushed first, so the
+        subroutine only holds the circuit. With `cache` unset the circuit is
+        built and compiled every time, as a plain flush would.
+        """
+        yield from connection.flush()
+        key = (tuple(circuit), copies, tuple(sorted(q.qubit_id for q in connection.active_qubits)))
+        compiled = self.compiled.get(key) if cache else None
+        if compiled is not None and key in self.verified:
+            self.hits += 1
+            groups = [tuple(Qubit(connection, add_new_command=False) for _ in range(self.num_qubits))
+                      for _ in range(copies)]
+            compiled.app_id = connection.app_id
+            subroutine = compiled
+        else:
+            self.misses += 1
+            groups = []
+            for _ in range(copies):
+                qubits = tuple(Qubit(connection) for _ in range(self.num_qubits))
+                apply_circuit(circuit, qubits)
+                groups.append(qubits)
+            # The circuit uses no registers or arrays, so the builder has nothing to reset afterwards
+            builder = connection.builder
+            subroutine = builder.subrt_compile_subroutine(builder.subrt_pop_pending_subroutine())
+            if compiled is not None:
+                # First reuse: only trust the compiled subroutine if it is the one built now
+                compiled.app_id = connection.app_id
+                if bytes(compiled) == bytes(subroutine):
+                    self.verified.add(key)
+                else:
+                    del self.compiled[key]
+                    self.uncacheable.add(key)
+            elif cache and key not in self.uncacheable:
+                self.compiled[key] = subroutine
+        yield from connection.commit_subroutine(subroutine)
+        return groups
@@ -0,0 +1,54 @@
+"""Search for the depolarization probability where failures leave the error-free baseline
+
+The failure rate is estimated at the low end of the range to get the
+baseline, and the crossing of `baseline + margin` is then bracketed by
+bisection in log10(p). Every bisection step uses more trials than the
+previous one, and a probe is extended while its confidence interval still
+contains the target, so the decisions near the crossing are the most precise.
+"""
+import math
+
+from wbc import stats
+
+
+def find_threshold(estimate, p_low, p_high, margin, tolerance=0.05, initial_trials=100,
+                   growth=1.5, max_trials=5000, baseline_trials=None,
+                   method="wilson", confidence=0.95):
+    """Bisect log10(p) for the crossing of the baseline failure rate plus `margin`
+
+    `estimate(p, num_trials)` runs `num_trials` trials at depolarization `p`
+    and returns `(failures, trials)`. The search stops once the bracket is
+    narrower than `tolerance` decades. Returns the geometric centre of the
+    final bracket and the list of probes as dicts.
+    """
+    interval = stats.INTERVALS[method]
+    failures, trials = estimate(p_low, baseline_trials or max_trials)
+    baseline = failures / trials
+    target = baseline + margin
+    probes = [{"p": p_low, "trials": trials, "failures": failures, "above": False}]
+
+    low, high = math.log10(p_low), math.log10(p_high)
+    step = 0
+    while high - low > tolerance:
+        mid = (low + high) / 2
+        p = 10 ** mid
+        budget = min(max_trials, int(initial_trials * growth ** step))
+        failures, trials = estimate(p, budget)
+        # Keep adding trials while the interval still straddles the target
+        while trials < max_trials:
+            lower, upper = interval(failures, trials, confidence)
+            if lower > target or upper < target:
+                break
+            more_failures, more_trials = estimate(p, min(trials, max_trials - trials))
+            failures += more_failures
+            trials += more_trials
+
+        above = failures / trials > target
+        probes.append({"p": p, "trials": trials, "failures": failures, "above": above})
+        if above:
+            high = mid
+        else:
+            low = mid
+        step += 1
+
+    return 10 ** ((low + high) / 2), probes
@@ -0,0 +1,122 @@
+"""Per-phase timing of the SquidASM programs
+
+A `PhaseTimer` splits a program run into named phases and accumulates, per
+phase, the wall time, the NetSquid simulated time and the number of NetQASM
+subroutines submitted, counted as "flushes" (one per non-empty flush, or per
+resubmission of a wbc.templates subroutine). Wall time is measured while the program's generator is
+suspended as well, so it includes the simulator work done on behalf of the
+other parties during that phase.
+
+The programs run through `timed_run`, which only times them when
+application.TIMING is set: the phases then go under the "timing" key of the
+result, so they are stored per trial with the rest of the result. Otherwise
+the timer's phases do nothing, and the connection is left untouched.
+`summarize` averages the timings over a list of trials.
+"""
+import time
+
+
+def sim_time():
+    """Current NetSquid simulation time in nanoseconds"""
+    import netsquid as ns
+
+    return ns.sim_time()
+
+
+class PhaseTimer:
+    def __init__(self, connection=None, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        self.current = None
+        self._wall_start = None
+        self._sim_start = None
+        self._connection = None
+        self._commit = None
+        if connection is not None:
+            self.attach(connection)
+
+    def attach(self, connection):
+        """Count every subroutine `connection` submits, including those of wbc.routines and wbc.templates"""
+        original = connection.commit_subroutine
+
+        def commit_subroutine(*args, **kwargs):
+            if self.current is not None:
+                self.phases[self.current]["flushes"] += 1
+            return (yield from original(*args, **kwargs))
+
+        # Only an attribute set on the instance itself is put back on it, the class's method is unshadowed
+        self._commit = vars(connection).get("commit_subroutine")
+        connection.commit_subroutine = commit_subroutine
+        self._connection = connection
+
+    def phase(self, name):
+        """End the current phase and start (or resume) phase `name`"""
+        if not self.enabled:
+            return
+        self._close()
+        self.phases.setdefault(name, {"wall": 0.0, "sim": 0.0, "flushes": 0})
+        self.current = name
+        self._wall_start = time.perf_counter()
+        self._sim_start = sim_time()
+
+    def stop(self):
+        """End the current phase and restore the connection's commit_subroutine"""
+        self._close()
+        self.current = None
+        if self._connection is not None:
+            if self._commit is None:
+                del self._connection.commit_subroutine
+            else:
+                self._connection.commit_subroutine = self._commit
+            self._connection = None
+        return self.as_dict()
+
+    def as_dict(self):
+        return {name: dict(counts) for name, counts in self.phases.items()}
+
+    def _close(self):
+        if self.current is not None:
+            counts = self.phases[self.current]
+            counts["wall"] += time.perf_counter() - self._wall_start
+            counts["sim"] += sim_time() - self._sim_start
+
+
+def timed_run(run, context, enabled):
+    """Run the program generator `run(context, timer)`, adding its phases to its result when `enabled`
+
+    A disabled timer neither wraps the connection's commit_subroutine nor
+    reads the simulated time. An enabled one restores commit_subroutine
+    however the run ends, also when it raises.
+    """
+    timer = PhaseTimer(context.connection if enabled else None, enabled)
+    try:
+        result = yield from run(context, timer)
+    finally:
+        timing = timer.stop()
+    if enabled:
+        result["timing"] = timing
+    return result
+
+
+def summarize(trials):
+    """{party: {phase: mean counts}} over per-trial (sender, receiver0, receiver1) results
+
+    Trials recorded without timings are left out of the means.
+    """
+    parties = ("Sender", "Receiver0", "Receiver1")
+    totals = {}
+    runs = {}
+    for trial in trials:
+        for party, result in zip(parties, trial):
+            if not result.get("timing"):
+                continue
+            for name, counts in result["timing"].items():
+                total = totals.setdefault(party, {}).setdefault(name, {})
+                for key, value in counts.items():
+                    total[key] = total.get(key, 0) + value
+            runs[party] = runs.get(party, 0) + 1
+    return {
+        party: {name: {key: value / runs[party] for key, value in phase.items()}
+                for name, phase in phases.items()}
+        for party, phases in totals.items()
+    }